@@ -4,6 +4,8 @@ A. Moghul - May 2019
 Input file
 ~~~~~~~~~~
 The .xlsx  RAGU format translated excel spreadsheet.  This is the output from TranslateDOORSScript.py
+Or, with a procedures file (-p), the untranslated script - which is then translated as it is split, so the translated
+spreadsheet is never saved and read back
 
 Output file(s)
 ~~~~~~~~~~~~~~
@@ -24,12 +26,20 @@ format will lead to files being generated in an unexpected manner, or cause the
 
 from openpyxl import Workbook
 from openpyxl import load_workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Alignment
 from openpyxl.styles import Font
 import logging
 import sys
 import getopt
 import os
+import csv
+import io
+import json
+import tarfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+import translateDOORSscript as translator
 
 # GLOBAL Definitions
 
@@ -38,17 +48,22 @@ INPUT_COL = 2
 OUTPUT_COL = 4
 CH='@'
 
+# Output formats - xlsx, csv and txt give one file per DOORS ID, jsonl gives one file with a line per DOORS ID,
+# and zip and tar give one archive holding a .csv file per DOORS ID
+OUTPUT_FORMATS = ('xlsx', 'csv', 'txt', 'jsonl', 'zip', 'tar')
 
-def open_excel(xl_filename: str) -> Workbook:
+
+def open_excel(xl_filename: str, read_only: bool = False) -> Workbook:
     """
     Opens an Excel file for processing, given the pathname
     :param xl_filename:
+    :param read_only: open the file for reading only, which is much faster for a large file
     :return:  Workbook
     """
     logging.info("open_excel")
 
     try:
-        wbook = load_workbook(xl_filename)  # Load file
+        wbook = load_workbook(xl_filename, read_only=read_only)  # Load file
         logging.info(f"Opened file {xl_filename}")
         return wbook
     except FileNotFoundError:
@@ -101,10 +116,20 @@ def showusage(myname: str):
     print(f"\nUsage:\n\tpython.exe {myname} "
           f"[-i | --infile] <inputfile> "
           f"[-o | --outfolder] <outputfolder> "
-          f"[-l | --logfile] <logfile>\n"
+          f"[-l | --logfile] <logfile> "
+          f"[-j | --jobs] <n> "
+          f"[-f | --format] <format> "
+          f"[-p | --procfile] <procfile> [-s | --substring]\n"
           "\t-i or --infile    is the Input script file (expected as Excel .xlsx)\n"
           "\t-o or --outfolder is the Output folder for generated files\n"    
-          "\t-l or --logfile   is the Logfle for Debug purposes\n")
+          "\t-l or --logfile   is the Logfle for Debug purposes\n"
+          "\t-j or --jobs      is the number of processes writing the generated files (defaults to 1)\n"
+          f"\t-f or --format    is the format of the generated files, one of {', '.join(OUTPUT_FORMATS)} "
+          "(defaults to xlsx)\n"
+          "\t                  jsonl writes one file with a line per ID, zip and tar one archive of .csv files\n"
+          "\t-p or --procfile  is the procedures file - the Input script is then the untranslated one, which is\n"
+          "\t                  translated as it is split, without saving the translated script\n"
+          "\t-s or --substring looks up procedure Ids not found exactly by substring, as translateDOORSscript.py\n")
 
 
 def process_command_line(argv):
@@ -122,9 +147,14 @@ def process_command_line(argv):
     excel_script_file = ''
     output_directory = ''
     logfile = ''
+    jobs = 1
+    out_format = 'xlsx'
+    procedure_file = ''
+    substring_match = False
 
     try:
-        opts, args = getopt.getopt(argv, "hi:o:l:", ["infile=", "output=", "logfile="])
+        opts, args = getopt.getopt(argv, "hi:o:l:j:f:p:s", ["infile=", "output=", "logfile=", "jobs=", "format=",
+                                                             "procfile=", "substring"])
 
     except getopt.GetoptError as e:
         print("\n\n", str(e))
@@ -145,6 +175,27 @@ def process_command_line(argv):
         elif opt in ("-l", "--logfile"):
             logfile = arg
 
+        elif opt in ("-j", "--jobs"):
+            try:
+                jobs = int(arg)
+            except ValueError:
+                print(f"The number of jobs must be a number, not {arg}")
+                showusage(sys.argv[0])
+                sys.exit(2)
+
+        elif opt in ("-f", "--format"):
+            out_format = arg.lower().lstrip('.')
+            if out_format not in OUTPUT_FORMATS:
+                print(f"Unknown output format {arg}")
+                showusage(sys.argv[0])
+                sys.exit(2)
+
+        elif opt in ("-p", "--procfile"):
+            procedure_file = arg
+
+        elif opt in ("-s", "--substring"):
+            substring_match = True
+
     if excel_script_file == '' or output_directory == '' or logfile == '':
         print("Please supply ALL inputs")
         showusage(sys.argv[0])
@@ -152,41 +203,51 @@ def process_command_line(argv):
         print(f"excel_script_file = {excel_script_file}")
         print(f"output_directory = {output_directory}")
         print(f"logfile = {logfile}")
+        if procedure_file:
+            print(f"procedure_file = {procedure_file}")
         print("Processing...")
 
-        generate_RAGU_files(excel_script_file, output_directory, logfile)
+        generate_RAGU_files(excel_script_file, output_directory, logfile, jobs, out_format, procedure_file,
+                            substring_match)
 
         print(f"Finished\nLogging information captured in {logfile}")
 
 
-def generate_RAGU_files(script_file: str, output_folder: str, logfile: str):
+def group_actions(worksheet) -> dict:
+    """
+        Reads the translated script in one pass, and groups the translated actions by DOORS module and ID
+        (see group_rows)
+    """
 
-    cell_wb = None
+    return group_rows((row[ID_COL - 1], row[OUTPUT_COL - 1])
+                      for row in worksheet.iter_rows(min_col=ID_COL, max_col=OUTPUT_COL, values_only=True))
 
-    # Setup the Logfile
-    logging.basicConfig(handlers=[ logging.FileHandler(logfile, 'w', 'utf-8')],
-                        level=logging.DEBUG,
-                        format='%(asctime)s - %(levelname)-8s - %(message)s',
-                        datefmt='%d-%b-%y %H:%M:%S')
 
-    if not os.path.exists(output_folder):                     # Check output directory exists before going too far
-        try:
-            os.mkdir(output_folder)
-        except Exception as e:
-            print("Unable to create diretory..", str(e))
-            exit(2)
+def translated_actions(worksheet, procedures: translator.ProcedureIndex):
+    """
+        Translates the untranslated script as it is read, giving back the (DOORS ID, action) of each row - the
+        CDNU allocation and translation are the generators translateDOORSscript uses, so nothing is written back
+    """
 
-    wb_script = open_excel(script_file)                        # Open the Excel file_names
-    worksheet = wb_script.active                               # Select active worksheet
-    old_id_raw = worksheet.cell(row=1, column=ID_COL).value    # initialise
-    old_id_list = old_id_raw.rsplit('/', 1)
-    old_id = old_id_list.pop()
-    cell_counter = 1
+    rows = translator.allocate_cdnus(translator.read_script_rows(worksheet))
+
+    for row in translator.translate_script(rows, procedures):
+        yield (row.values[ID_COL - 1] if row.values else None), row.output
+
+
+def group_rows(rows) -> dict:
+    """
+        Groups the translated actions, given as (DOORS ID, action) rows, by DOORS module and ID.
+        Returns a dict of (module, ID) : [actions], in the order the IDs first appear in the script.
+        An ID which appears more than once is merged into one file, so the groups are only complete at the end
+        of the script - but only the actions are held, never the rows of the workbook
+    """
 
-    for cell in worksheet['B']:
+    groups = {}
 
-        cell_id = worksheet.cell(row=cell.row, column=ID_COL).value
-        cell_action = worksheet.cell(row=cell.row, column=OUTPUT_COL).value
+    for cell_id, cell_action in rows:
+        if cell_id is None:                                    # Skip any empty rows
+            continue
 
         stripped_list = cell_id.rsplit('/', 1)                 # strip out the doors module id
         real_id = stripped_list.pop()
@@ -198,39 +259,231 @@ def generate_RAGU_files(script_file: str, output_folder: str, logfile: str):
 
         module_str = stripped_module.replace('/', '_')
 
-        if old_id == real_id:
-            if cell_wb:
-                cell_counter = cell_counter + 1
-                pass
-            else:
-                cell_wb = Workbook()
-                cell_ws = cell_wb.active
-                cell_ws.cell(1, 1, "Actions")
-                cell_ws.column_dimensions['A'].width = 150
-
-            cell_ws.cell(cell_counter, 1).font = Font(size=10)
-            cell_ws.cell(cell_counter, 1, cell_action)
-            cell_ws.cell(cell_counter, 1).alignment = Alignment(horizontal='left')
-            logging.debug(f"{real_id} - {cell_action}")
+        groups.setdefault((module_str, real_id), []).append(cell_action)
+        logging.debug(f"{real_id} - {cell_action}")
+
+    return groups
+
+
+def ragu_lines(actions: list) -> list:
+    """
+        The lines written out for one DOORS ID - an "Actions" heading, then the actions.
+        As before, the first action of each ID is not written out
+    """
+
+    return ["Actions"] + ['' if action is None else str(action) for action in actions[1:]]
+
+
+def ragu_csv_text(actions: list) -> str:
+    """
+        The lines for one DOORS ID as the text of a single column .csv file
+    """
+
+    text = io.StringIO()
+    csv.writer(text).writerows([line] for line in ragu_lines(actions))
+
+    return text.getvalue()
+
+
+def write_RAGU_csv(full_pathname: str, actions: list):
+    """
+        Writes the actions for one DOORS ID into its own .csv file
+    """
+
+    with open(full_pathname, 'w', encoding='utf-8', newline='') as csv_file:
+        csv_file.write(ragu_csv_text(actions))
+
+
+def write_RAGU_txt(full_pathname: str, actions: list):
+    """
+        Writes the actions for one DOORS ID into its own text file, one per line.
+        Unlike .csv, an action which itself runs over several lines can not be told apart from the next action
+    """
+
+    with open(full_pathname, 'w', encoding='utf-8') as txt_file:
+        txt_file.write('\n'.join(ragu_lines(actions)) + '\n')
+
+
+def write_RAGU_xlsx(full_pathname: str, actions: list):
+    """
+        Writes the actions for one DOORS ID into its own Excel file, with an "Actions" heading.
+        As before, the first action of each ID is not written out
+    """
+
+    cell_wb = Workbook(write_only=True)
+    cell_ws = cell_wb.create_sheet()
+    cell_ws.column_dimensions['A'].width = 150
+
+    font = Font(size=10)
+    alignment = Alignment(horizontal='left')
+
+    cell_ws.append(["Actions"])
+
+    for cell_action in actions[1:]:
+        cell = WriteOnlyCell(cell_ws, value=cell_action)
+        cell.font = font
+        cell.alignment = alignment
+        cell_ws.append([cell])
+
+    cell_wb.save(full_pathname)
+    cell_wb.close()
+
+
+# Writers for the formats giving one file per DOORS ID
+RAGU_FILE_WRITERS = {'xlsx': write_RAGU_xlsx, 'csv': write_RAGU_csv, 'txt': write_RAGU_txt}
+
+
+def ragu_name(module_str: str, real_id: str, out_format: str) -> str:
+    """
+        The name of the file for one DOORS ID, in the format DOORSMODULE@ID@.<format>
+    """
+
+    return module_str + CH + real_id + CH + '.' + out_format
 
+
+def write_RAGU_files(output_folder: str, groups: dict, jobs: int = 1, out_format: str = 'xlsx'):
+    """
+        Writes one file per DOORS ID, either one after the other, or across jobs processes
+    """
+
+    writer = RAGU_FILE_WRITERS[out_format]
+
+    pathnames = []
+    for module_str, real_id in groups:
+        full_pathname = output_folder + '/' + ragu_name(module_str, real_id, out_format)
+        logging.debug(f"Full Pathname = {full_pathname}")
+        pathnames.append(full_pathname)
+
+    try:
+        if jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                list(pool.map(writer, pathnames, groups.values(),
+                              chunksize=max(1, len(pathnames) // (jobs * 4))))
         else:
-            full_pathname = output_folder + '/' + module_str + CH + old_id + CH + '.xlsx'
-            logging.debug(f"Full Pathname = {full_pathname}")
+            for full_pathname, actions in zip(pathnames, groups.values()):
+                writer(full_pathname, actions)
 
-            try:
-                cell_wb.save(full_pathname)
-                cell_wb.close()
-            except Exception as e:
-                print("Unable to save files in output directory. Aborting...", str(e))
-                exit(2)
-            else:
-                cell_wb = None
-                cell_counter = 2
-
-        old_id = real_id
-
-    # Close Filenames
-    close_excel(wb_script, script_file)
+    except Exception as e:
+        print("Unable to save files in output directory. Aborting...", str(e))
+        exit(2)
+
+
+def write_RAGU_bundle(full_pathname: str, groups: dict, out_format: str):
+    """
+        Writes every DOORS ID into one file - either a JSON-lines file with one line per DOORS ID, keyed by
+        DOORSMODULE@ID, or a zip/tar archive holding a DOORSMODULE@ID@.csv file per DOORS ID
+    """
+
+    logging.debug(f"Full Pathname = {full_pathname}")
+
+    try:
+        if out_format == 'jsonl':
+            with open(full_pathname, 'w', encoding='utf-8') as jsonl_file:
+                for (module_str, real_id), actions in groups.items():
+                    jsonl_file.write(json.dumps({"key": module_str + CH + real_id,
+                                                 "module": module_str,
+                                                 "id": real_id,
+                                                 "actions": ragu_lines(actions)[1:]}) + '\n')
+
+        elif out_format == 'zip':
+            with zipfile.ZipFile(full_pathname, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+                for (module_str, real_id), actions in groups.items():
+                    zip_file.writestr(ragu_name(module_str, real_id, 'csv'), ragu_csv_text(actions))
+
+        else:
+            with tarfile.open(full_pathname, 'w') as tar_file:
+                for (module_str, real_id), actions in groups.items():
+                    data = ragu_csv_text(actions).encode('utf-8')
+                    member = tarfile.TarInfo(ragu_name(module_str, real_id, 'csv'))
+                    member.size = len(data)
+                    tar_file.addfile(member, io.BytesIO(data))
+
+    except Exception as e:
+        print("Unable to save files in output directory. Aborting...", str(e))
+        exit(2)
+
+
+def generate_RAGU_files(script_file: str, output_folder: str, logfile: str, jobs: int = 1,
+                        out_format: str = 'xlsx', procedure_file: str = '', substring_match: bool = False):
+    """
+        Splits the translated script into the RAGU files. With a procedures file, the script is an untranslated
+        one, which is translated as it is split (see translate_and_split)
+    """
+
+    # Setup the Logfile
+    logging.basicConfig(handlers=[ logging.FileHandler(logfile, 'w', 'utf-8')],
+                        level=logging.DEBUG,
+                        format='%(asctime)s - %(levelname)-8s - %(message)s',
+                        datefmt='%d-%b-%y %H:%M:%S')
+
+    if procedure_file:
+        procedures = translator.load_procedure_index(procedure_file, substring_match)
+        translate_and_split(script_file, procedures, output_folder, jobs, out_format)
+    else:
+        split_script(script_file, output_folder, jobs, out_format)
+
+
+def split_script(script_file: str, output_folder: str, jobs: int = 1, out_format: str = 'xlsx') -> int:
+    """
+        Splits the translated script into the RAGU files, once the logging is set up (see generate_RAGU_files).
+        Returns the number of DOORS IDs
+    """
+
+    make_output_folder(output_folder)
+
+    wb_script = open_excel(script_file, read_only=True)        # Open the Excel file_names
+    groups = group_actions(wb_script.active)                   # Select active worksheet
+    wb_script.close()                                          # Nothing is written back to the script
+
+    return write_groups(script_file, output_folder, groups, jobs, out_format)
+
+
+def translate_and_split(script_file: str, procedures: translator.ProcedureIndex, output_folder: str,
+                        jobs: int = 1, out_format: str = 'xlsx') -> int:
+    """
+        Translates the untranslated script and splits it into the RAGU files in one pass, as a chain of generators:
+        read rows -> allocate CDNU -> translate -> group by module@ID -> write the files.
+        The translated workbook is never built or saved. Returns the number of DOORS IDs
+    """
+
+    make_output_folder(output_folder)
+
+    wb_script = open_excel(script_file, read_only=True)
+    groups = group_rows(translated_actions(wb_script.active, procedures))
+    wb_script.close()
+
+    return write_groups(script_file, output_folder, groups, jobs, out_format)
+
+
+def make_output_folder(output_folder: str):
+    """
+        Checks the output directory exists before going too far, creating it if needed
+    """
+
+    if not os.path.exists(output_folder):
+        try:
+            os.mkdir(output_folder)
+        except Exception as e:
+            print("Unable to create diretory..", str(e))
+            exit(2)
+
+
+def write_groups(script_file: str, output_folder: str, groups: dict, jobs: int, out_format: str) -> int:
+    """
+        Writes the grouped actions as one file per DOORS ID, or as one bundle named after the script.
+        Returns the number of DOORS IDs. Raises ValueError if the format is not one of OUTPUT_FORMATS
+    """
+
+    if out_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format {out_format}")
+
+    if out_format in RAGU_FILE_WRITERS:
+        write_RAGU_files(output_folder, groups, jobs, out_format)
+    else:
+        bundle_name = os.path.splitext(os.path.basename(script_file))[0] + '.' + out_format
+        write_RAGU_bundle(output_folder + '/' + bundle_name, groups, out_format)
+
+    return len(groups)
 
 
 # #########################################################################
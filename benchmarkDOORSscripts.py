@@ -0,0 +1,537 @@
+"""
+Measures how fast translateDOORSscript.py and CreateRAGUFiles.py run, so that any slow down can be spotted by
+comparing the results over time.
+
+A synthetic DOORS script is generated, with a configurable number of rows and mix of commands, along with a
+procedures file holding every ID it refers to. The script is then taken through each stage, as the streamed
+translation would, and each stage is timed:
+
+    generate    building and saving the synthetic script (not part of the translation)
+    load        opening the script read-only and reading the rows
+    cdnu        allocating the CDNU for each row
+    translate   translating the rows, with the calls, matches and time for each rule (handler) recorded
+                separately (see translateDOORSscript.RuleProfile)
+    format      writing the translated rows, with their styles, to a write-only workbook - which writes each row
+                out to a temporary file as it goes, so this is most of the cost of saving
+    save        saving the translated workbook
+    split       splitting the translated workbook into one RAGU file per DOORS ID
+
+The results are written as JSON. With --memory, the peak memory of each stage is measured too, using tracemalloc,
+which makes every stage a lot slower - so the timings of a --memory run should only be compared with other
+--memory runs.
+
+With --adversarial, long rows crafted to nearly match each rule (the kind of row which made the regexes backtrack
+for minutes) are translated instead, one at a time, and the run fails if any row takes longer than the limit.
+It also checks that a row driven over a tiny --row-budget is given the budget ALERT by its own translation, and
+that the ALERT is not reused (from the memo) for the same row again.
+"""
+
+import getopt
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import openpyxl
+from openpyxl import Workbook
+
+import translateDOORSscript as translator
+import CreateRAGUFiles as splitter
+
+# GLOBAL Definitions
+
+DEFAULT_ROWS = 20000
+DEFAULT_ROWS_PER_ID = 8
+DEFAULT_SEED = 1
+
+# The command mix - the relative weight of each kind of command in the generated script
+DEFAULT_MIX = {
+    'keys': 40,
+    'procedure': 5,
+    'sim_1553': 10,
+    'bus_analyser': 5,
+    'inspect': 10,
+    'waitfor': 10,
+    'arinc': 5,
+    'power': 5,
+    'test_rig': 2,
+}
+
+# Rows in each Bus Analyser word block
+BUS_WORDS = 4
+
+KEY_ROWS = ["Press DATA", "Press LK3 - select page", "Press MARK / FIX to mark", "On CDNU2: Press FPLN",
+            "Press NAV then ENT", "Press CLR", "On Both CDNUs:", "On CDNU1:", "LLK2 pressed"]
+INSPECT_ROWS = ["Inspect({n}): LK2 - upper line shows ### Inspect({n}): The FUEL value is {val}",
+                "Inspect({n}): LK1 - xyz ### comment: Altitude = {val}"]
+WAITFOR_ROWS = ["Wait {n} seconds", "Wait for at least {n} minutes", "Wait a few seconds"]
+ARINC_ROWS = ["ARINC Simulator: Set ALTITUDE to {val} (feet)", "ARINC Simulator: Set NAV mode to 1 (x)"]
+POWER_ROWS = ["Power on CDNU1", "Power off both CDNUs", "Power on CDNU2"]
+TEST_RIG_ROWS = ["Test Rig: Set the Squat switch to ON", "Test Rig: Set the Squat switch to OFF"]
+SIM_1553_ROWS = ["1553 Simulator: Set RT{rt} SA{sa} Word {n} to hex {hex} (altitude)",
+                 "1553 Simulator: Set SA{sa} Word {n} to dec {val}",
+                 "1553 Simulator: Set RT{rt} SA{sa} Words {n} to {n2}",
+                 "1553 Simulator: Enable RT{rt} SA{sa}",
+                 "1553 Simulator: Disable RT{rt}"]
+
+# Rows which nearly match a rule, repeating the part which used to make its regexes backtrack, by the rule they
+# are aimed at - either the tail after the command, or the whole command. Each is repeated up to about
+# ADVERSARIAL_LENGTH characters
+ADVERSARIAL_ROWS = {
+    'arinc': ("ARINC Simulator: set x", " to ("),
+    'arinc_to': ("ARINC Simulator: set ", "to "),
+    'arinc_command': ("", "ARINC Simulator: set x to ("),
+    'inspect_set': ("Inspect(1): LK1 - ", "### :"),
+    'inspect_set_command': ("", "Inspect(1):  LK1 - ###a:"),
+    'inspect_comment': ("Inspect(1): ", "LK1 x "),
+    'inspect_comment_command': ("", "Inspect(1): LK1 x "),
+    'inspect_is': ("Inspect(1): LK1 x ### Inspect(1): ", " is"),
+    'sim_1553': ("", "1553 Simulator: "),
+    'sim_1553_colon': ("1553 Simulat", ":"),
+    'sim_1553_bracket': ("1553 Simulator: Set RT1 SA2 Word 3 to 4 ", "("),
+    'sim_1553_command': ("", "1553 Simulator: Set RT1 SA2 Word 3 to 4 ("),
+    'waitfor': ("Wait ", "5 "),
+    'power': ("", "Power on "),
+    'bus_analyser': ("", "Bus Analyser: set "),
+    'bus_analyser_set': ("", "Bus Analyser: Set BC1 RT04 Word 1 to 16#FFFF "),
+    'test_rig': ("Test Rig: set ", " to "),
+    'test_rig_command': ("", "Test Rig: set x"),
+    'keys': ("", "LLK"),
+    'procedure': ("", "as in ID "),
+}
+ADVERSARIAL_LENGTH = 20000
+ADVERSARIAL_LIMIT = 1.0                             # most seconds any one of the rows may take
+
+# Row translated over a budget no row can keep to, by check_row_budget
+BUDGET_ROW = "Press DATA"
+BUDGET_SECONDS = 1e-9
+
+
+def showusage(myname: str):
+    """
+        When running the script in command line, the options which can be provided are shown here
+    """
+
+    print(f"\nUsage:\n\tpython.exe {myname} "
+          f"[-r | --rows] <rows> [-m | --mix] <mix> [-o | --output] <resultfile> "
+          f"[-f | --format] <format> [-s | --seed] <seed> [--memory] [--keep <folder>] [--memo-size <n>]\n"
+          f"\tpython.exe {myname} --adversarial [-o | --output] <resultfile> [--limit <seconds>]\n"
+          f"\t-r or --rows     is the number of rows in the synthetic script (defaults to {DEFAULT_ROWS})\n"
+          "\t-m or --mix      is the relative weight of each command, e.g \"keys=40,bus_analyser=10\". Commands not\n"
+          f"\t                 given keep their default weights: {format_mix(DEFAULT_MIX)}\n"
+          "\t-o or --output   is the JSON file for the results (defaults to printing them)\n"
+          "\t-f or --format   is the format of the split RAGU files (defaults to xlsx)\n"
+          f"\t-s or --seed     is the seed for the synthetic script (defaults to {DEFAULT_SEED})\n"
+          "\t--memory         also measures the peak memory of each stage, which slows every stage down\n"
+          "\t--keep           keeps the generated and translated files in the given folder\n"
+          "\t--memo-size      is the size of the memo of repeated rows (defaults to that of translateDOORSscript.py),\n"
+          "\t                 0 times the rules on every row\n"
+          "\t--adversarial    times the crafted rows which nearly match each rule, and fails (exit 1) if any takes\n"
+          f"\t                 longer than --limit seconds (defaults to {ADVERSARIAL_LIMIT}), or if a row driven over\n"
+          "\t                 the --row-budget of translateDOORSscript.py is not given its ALERT exactly once\n")
+
+
+def format_mix(mix: dict) -> str:
+    return ",".join(f"{kind}={weight}" for kind, weight in mix.items())
+
+
+def parse_mix(mix_str: str) -> dict:
+    """
+        Parses a command mix such as "keys=40,bus_analyser=10", on top of the default mix
+    """
+
+    mix = dict(DEFAULT_MIX)
+
+    for item in mix_str.split(','):
+        kind, _, weight = item.partition('=')
+        kind = kind.strip()
+
+        if kind not in DEFAULT_MIX:
+            raise ValueError(f"Unknown command {kind}, expected one of {', '.join(DEFAULT_MIX)}")
+
+        mix[kind] = int(weight)
+
+    return mix
+
+
+def command_rows(kind: str, rand: random.Random, proc_ids: list) -> list:
+    """
+        The text of the row(s) for one command of the given kind
+    """
+
+    fields = {'n': rand.randint(1, 30), 'n2': rand.randint(31, 60), 'val': rand.randint(0, 5000),
+              'rt': rand.randint(1, 30), 'sa': rand.randint(1, 30), 'hex': f"{rand.randint(0, 0xFFFF):04X}"}
+
+    if kind == 'keys':
+        return [rand.choice(KEY_ROWS)]
+    if kind == 'procedure':
+        return [f"Perform as in ID {rand.choice(proc_ids)} the procedure"]
+    if kind == 'inspect':
+        return [rand.choice(INSPECT_ROWS).format(**fields)]
+    if kind == 'waitfor':
+        return [rand.choice(WAITFOR_ROWS).format(**fields)]
+    if kind == 'arinc':
+        return [rand.choice(ARINC_ROWS).format(**fields)]
+    if kind == 'power':
+        return [rand.choice(POWER_ROWS)]
+    if kind == 'test_rig':
+        return [rand.choice(TEST_RIG_ROWS)]
+    if kind == 'sim_1553':
+        return [rand.choice(SIM_1553_ROWS).format(**fields)]
+
+    # bus_analyser - a command followed by a block of Word rows, the last of which may be a ramp
+    if rand.random() < 0.5:
+        rows = [f"Bus Analyser: Set BC1 RT{fields['rt']:02} words as follows:"]
+    else:
+        rows = [f"Bus Analyser: Transmit the following data for BC1 RT{fields['rt']:02}"]
+
+    for word in range(1, BUS_WORDS + 1):
+        rows.append(f"Word {word}: 16#{rand.randint(0, 0xFFFF):04X} value {word}")
+
+    if rand.random() < 0.25:
+        rows[-1] = f"Word {BUS_WORDS}: Ramp up from 16#0000 to 16#0010 in steps of 16#00004 ramp"
+
+    return rows
+
+
+def generate_script(script_file: str, procedure_file: str, rows: int, mix: dict, seed: int,
+                    rows_per_id: int = DEFAULT_ROWS_PER_ID) -> int:
+    """
+        Generates a synthetic DOORS script of about the given number of rows, with the given command mix.
+        Each DOORS ID starts with an "Actions" row. Returns the number of rows generated
+    """
+
+    rand = random.Random(seed)
+    kinds = [kind for kind, weight in mix.items() if weight > 0]
+    weights = [mix[kind] for kind in kinds]
+    proc_ids = [str(1000 + n) for n in range(50)]
+
+    wb_script = Workbook(write_only=True)
+    ws_script = wb_script.create_sheet()
+
+    row_count = 0
+    doors_id = 0
+
+    while row_count < rows:
+        doors_id = doors_id + 1
+        texts = ["Actions"]
+
+        while len(texts) < rows_per_id:
+            texts.extend(command_rows(rand.choices(kinds, weights)[0], rand, proc_ids))
+
+        for text in texts:
+            ws_script.append([f"/Project/Sub/Module/{doors_id}", text])
+
+        row_count = row_count + len(texts)
+
+    wb_script.save(script_file)
+
+    wb_procedures = Workbook(write_only=True)
+    ws_procedures = wb_procedures.create_sheet()
+    ws_procedures.append(["Id", "Name"])
+
+    for proc_id in proc_ids:
+        ws_procedures.append([proc_id, f"Proc_{proc_id}"])
+
+    wb_procedures.save(procedure_file)
+
+    return row_count
+
+
+class StageTimer:
+    """
+    Times each stage of the benchmark, and its peak memory when tracemalloc is running
+    """
+
+    def __init__(self, memory: bool):
+        self.memory = memory
+        self.stages = {}
+
+    def run(self, name: str, rows: int, stage, *args):
+        """
+            Runs stage(*args), recording how long it took. Returns what the stage returns
+        """
+
+        if self.memory:
+            tracemalloc.reset_peak()
+
+        started = time.perf_counter()
+        result = stage(*args)
+        seconds = time.perf_counter() - started
+
+        self.stages[name] = {'seconds': round(seconds, 4),
+                             'rows_per_sec': round(rows / seconds, 1) if seconds > 0 else None}
+
+        if self.memory:
+            self.stages[name]['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 2)
+
+        print(f"{name:<10} {seconds:8.3f}s {self.stages[name]['rows_per_sec'] or 0:12.0f} rows/sec")
+
+        return result
+
+
+def translate_timed(rows: list, procedures, memo) -> tuple:
+    """
+        Translates the rows with each rule timed by a RuleProfile. Returns the rows and the statistics for each rule.
+        Rows repeated in the script are taken from the memo, so the rules are only timed for the others
+    """
+
+    profile = translator.RuleProfile()
+    translated = list(translator.translate_script(rows, procedures, profile=profile, memo=memo))
+
+    return translated, profile.results()['rules']
+
+
+def format_rows(rows: list, title: str) -> Workbook:
+    """
+        Writes the translated rows to a write-only workbook, as the streamed translation does
+    """
+
+    wb_output = Workbook(write_only=True)
+    out_sheet = wb_output.create_sheet(title)
+    translator.add_output_styles(wb_output)
+
+    for row in rows:
+        translator.write_streamed_row(out_sheet, row)
+
+    return wb_output
+
+
+def split_script(output_file: str, ragu_folder: str, out_format: str) -> int:
+    """
+        Splits the translated script into one RAGU file per DOORS ID. Returns the number of DOORS IDs
+    """
+
+    wb_script = splitter.open_excel(output_file, read_only=True)
+    groups = splitter.group_actions(wb_script.active)
+    wb_script.close()
+
+    if out_format in splitter.RAGU_FILE_WRITERS:
+        splitter.write_RAGU_files(ragu_folder, groups, 1, out_format)
+    else:
+        splitter.write_RAGU_bundle(ragu_folder + '/benchmark.' + out_format, groups, out_format)
+
+    return len(groups)
+
+
+def run_benchmark(folder: str, rows: int, mix: dict, seed: int, out_format: str, memory: bool,
+                  memo_size: int = translator.MEMO_SIZE) -> dict:
+    """
+        Runs every stage on a synthetic script in the given folder. Returns the results
+    """
+
+    script_file = os.path.join(folder, 'script.xlsx')
+    procedure_file = os.path.join(folder, 'procedures.xlsx')
+    output_file = os.path.join(folder, 'translated.xlsx')
+    ragu_folder = os.path.join(folder, 'ragu')
+    os.makedirs(ragu_folder, exist_ok=True)
+
+    timer = StageTimer(memory)
+    memo = translator.TranslationMemo(memo_size)
+
+    if memory:
+        tracemalloc.start()
+
+    try:
+        rows = timer.run('generate', rows, generate_script, script_file, procedure_file, rows, mix, seed)
+
+        procedures = translator.load_procedure_index(procedure_file)
+
+        wb_script = translator.open_excel(script_file, read_only=True)
+        script_rows = timer.run('load', rows, lambda: list(translator.read_script_rows(wb_script.active)))
+        title = wb_script.active.title
+        wb_script.close()
+
+        script_rows = timer.run('cdnu', rows, lambda: list(translator.allocate_cdnus(script_rows)))
+        script_rows, handlers = timer.run('translate', rows, translate_timed, script_rows, procedures, memo)
+        wb_output = timer.run('format', rows, format_rows, script_rows, title)
+        timer.run('save', rows, wb_output.save, output_file)
+        doors_ids = timer.run('split', rows, split_script, output_file, ragu_folder, out_format)
+    finally:
+        if memory:
+            tracemalloc.stop()
+
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'openpyxl': openpyxl.__version__,
+        'platform': platform.platform(),
+        'rows': rows,
+        'doors_ids': doors_ids,
+        'mix': mix,
+        'seed': seed,
+        'ragu_format': out_format,
+        'memory': memory,
+        'memo': {'size': memo_size, 'hits': memo.hits, 'misses': memo.misses},
+        'stages': timer.stages,
+        'handlers': handlers,
+    }
+
+
+def check_row_budget() -> str:
+    """
+        Translates the BUDGET_ROW twice over a tiny row_time_budget, sharing a memo. Each must be given the budget
+        ALERT once, by its own translation rather than from the memo, and the row must then translate without it
+        once the budget is lifted. Returns what went wrong, or '' if nothing did
+    """
+
+    procedures = translator.index_procedures([])
+    memo = translator.TranslationMemo()
+    budget = translator.row_time_budget
+
+    try:
+        translator.row_time_budget = BUDGET_SECONDS
+        over_budget = list(translator.translate_rows([BUDGET_ROW, BUDGET_ROW], procedures, memo=memo))
+        translated_again = memo.misses
+
+        translator.row_time_budget = None
+        unbudgeted = next(translator.translate_rows([BUDGET_ROW], procedures, memo=memo))
+    finally:
+        translator.row_time_budget = budget
+
+    alerts = [str(row.error).count(translator.BUDGET_ALERT) for row in over_budget]
+
+    if alerts != [1, 1]:
+        return f"Expected the budget ALERT once on each row, found {alerts}"
+    if translated_again != 2:
+        return f"The budget ALERT was reused from the memo ({translated_again} of 2 rows translated)"
+    if unbudgeted.error is not None:
+        return f"The budget ALERT was kept for the row: {unbudgeted.error}"
+
+    return ''
+
+
+def run_adversarial(limit: float = ADVERSARIAL_LIMIT) -> dict:
+    """
+        Translates each of the ADVERSARIAL_ROWS on its own, with no memo, timing each. Returns the results
+    """
+
+    procedures = translator.index_procedures([])
+    timings = {}
+
+    for name, (start, repeat) in ADVERSARIAL_ROWS.items():
+        text = start + repeat * ((ADVERSARIAL_LENGTH - len(start)) // len(repeat))
+        row = translator.ScriptRow(1, text, 'CDNU1')
+
+        started = time.perf_counter()
+        list(translator.translate_script([row], procedures, memo=translator.TranslationMemo(0)))
+        seconds = time.perf_counter() - started
+
+        timings[name] = {'length': len(text), 'seconds': round(seconds, 4)}
+        print(f"{name:<24} {len(text):8} chars {seconds:8.3f}s{'  TOO SLOW' if seconds > limit else ''}")
+
+    budget_error = check_row_budget()
+    print(f"row budget               {budget_error or 'OK'}")
+
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'limit': limit,
+        'too_slow': [name for name, timing in timings.items() if timing['seconds'] > limit],
+        'rows': timings,
+        'row_budget_error': budget_error,
+    }
+
+
+def process_command_line(argv):
+    """
+        Parses the command line options, and runs the benchmark
+    """
+
+    rows = DEFAULT_ROWS
+    mix = dict(DEFAULT_MIX)
+    result_file = ''
+    out_format = 'xlsx'
+    seed = DEFAULT_SEED
+    memory = False
+    keep_folder = ''
+    memo_size = translator.MEMO_SIZE
+    adversarial = False
+    limit = ADVERSARIAL_LIMIT
+
+    try:
+        opts, args = getopt.getopt(argv, "hr:m:o:f:s:", ["rows=", "mix=", "output=", "format=", "seed=",
+                                                          "memory", "keep=", "memo-size=", "adversarial",
+                                                          "limit="])
+        for opt, arg in opts:
+            if opt == '-h':
+                showusage(sys.argv[0])
+                sys.exit()
+
+            elif opt in ("-r", "--rows"):
+                rows = int(arg)
+
+            elif opt in ("-m", "--mix"):
+                mix = parse_mix(arg)
+
+            elif opt in ("-o", "--output"):
+                result_file = arg
+
+            elif opt in ("-f", "--format"):
+                out_format = arg.lower().lstrip('.')
+                if out_format not in splitter.OUTPUT_FORMATS:
+                    raise ValueError(f"Unknown RAGU format {arg}")
+
+            elif opt in ("-s", "--seed"):
+                seed = int(arg)
+
+            elif opt == "--memory":
+                memory = True
+
+            elif opt == "--keep":
+                keep_folder = arg
+
+            elif opt == "--memo-size":
+                memo_size = int(arg)
+
+            elif opt == "--adversarial":
+                adversarial = True
+
+            elif opt == "--limit":
+                limit = float(arg)
+
+    except (getopt.GetoptError, ValueError) as e:
+        print("\n\n", str(e))
+        showusage(sys.argv[0])
+        sys.exit(2)
+
+    logging.disable(logging.CRITICAL)                         # The translation logging is not part of the benchmark
+
+    if adversarial:
+        results = run_adversarial(limit)
+    elif keep_folder:
+        os.makedirs(keep_folder, exist_ok=True)
+        results = run_benchmark(keep_folder, rows, mix, seed, out_format, memory, memo_size)
+    else:
+        with tempfile.TemporaryDirectory() as folder:
+            results = run_benchmark(folder, rows, mix, seed, out_format, memory, memo_size)
+
+    if result_file:
+        with open(result_file, 'w', encoding='utf-8') as result:
+            json.dump(results, result, indent=2)
+        print(f"Results written to {result_file}")
+    else:
+        print(json.dumps(results, indent=2))
+
+    if adversarial and (results['too_slow'] or results['row_budget_error']):
+        if results['too_slow']:
+            print(f"\n{len(results['too_slow'])} rows took longer than {limit}s: {', '.join(results['too_slow'])}")
+        if results['row_budget_error']:
+            print(f"\nRow budget check failed: {results['row_budget_error']}")
+        sys.exit(1)
+
+
+# #########################################################################
+# # MAIN
+# #########################################################################
+
+if __name__ == "__main__":
+
+    process_command_line(sys.argv[1:])
@@ -0,0 +1,154 @@
+"""
+Sends translate and split requests to a running translation service (translateDOORSscript.py --serve), so that
+CI jobs do not pay for starting Python, importing openpyxl and indexing the procedures file on every script.
+
+Only the standard library is imported here, so the client itself starts quickly. The files are read and written
+by the service, so the paths given should be ones the service can see - relative paths are made absolute here.
+Each request carries the token the service wrote to its token file when it started.
+
+Exits with 0 if the request succeeded, 1 if the service reported an error or could not be reached, and 2 if the
+command line is wrong.
+"""
+
+import getopt
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+
+# GLOBAL Definitions
+
+DEFAULT_PORT = 8765                                 # must match SERVICE_PORT in translateDOORSscript.py
+TOKEN_HEADER = 'X-Service-Token'                    # must match SERVICE_TOKEN_HEADER in translateDOORSscript.py
+OUTPUT_FORMATS = ('xlsx', 'csv', 'txt', 'jsonl', 'zip', 'tar')      # must match OUTPUT_FORMATS in CreateRAGUFiles.py
+
+
+def token_file(port: int) -> str:
+    """
+        Where the service started on the port keeps its token - as service_token_file in translateDOORSscript.py
+    """
+
+    return os.path.join(os.path.expanduser('~'), f".translateDOORSscript-{port}.token")
+
+
+def send_request(port: int, command: str, request: dict) -> dict:
+    """
+        POSTs the request to the service, with its token, and returns its JSON reply
+    """
+
+    with open(token_file(port), encoding='utf-8') as token_in:
+        token = token_in.read().strip()
+
+    body = json.dumps(request).encode('utf-8')
+    http_request = urllib.request.Request(f"http://127.0.0.1:{port}/{command}", data=body,
+                                          headers={'Content-Type': 'application/json', TOKEN_HEADER: token})
+
+    try:
+        with urllib.request.urlopen(http_request) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as ex:            # the service replies with an error status when a request fails
+        return json.loads(ex.read())
+
+
+def showusage(myname: str):
+    """
+        When running the script in command line, the options which can be provided are shown here
+    """
+
+    print(f"\nUsage:\n\tpython.exe {myname} [-i | --infile] <inputfile> [-p | --procfile] <procfile> "
+          f"[-o | --outfile] <outputfile> [-s | --substring] [-j | --jobs] <n> [--no-format] [--port] <port>\n"
+          f"\tpython.exe {myname} --split [-i | --infile] <translatedfile> [-o | --outfile] <outputfolder> "
+          f"[-f | --format] <format> [-j | --jobs] <n> [--port] <port>\n"
+          f"\tpython.exe {myname} --split [-i | --infile] <scriptfile> [-p | --procfile] <procfile> [-s | --substring] "
+          f"[-o | --outfile] <outputfolder> [-f | --format] <format> [-j | --jobs] <n> [--port] <port>\n"
+          f"\tpython.exe {myname} --status [--port] <port>\n"
+          f"\tpython.exe {myname} --shutdown [--port] <port>\n"
+          f"\n\tThe service is started with: python.exe translateDOORSscript.py --serve -l <logfile>\n"
+          f"\t--port defaults to {DEFAULT_PORT}. The service token is read from {token_file('<port>')}\n")
+
+
+def process_command_line(argv):
+    """
+        Parses the command line options, sends the request and exits with its result
+    """
+
+    command = 'translate'
+    request = {}
+    port = DEFAULT_PORT
+
+    try:
+        opts, args = getopt.getopt(argv, "hi:p:o:sj:f:", ["infile=", "procfile=", "outfile=", "substring", "jobs=",
+                                                          "no-format", "split", "format=", "status", "shutdown",
+                                                          "port="])
+        for opt, arg in opts:
+            if opt == '-h':
+                showusage(sys.argv[0])
+                sys.exit()
+
+            elif opt in ("-i", "--infile"):
+                request['infile'] = os.path.abspath(arg)
+
+            elif opt in ("-p", "--procfile"):
+                request['procfile'] = os.path.abspath(arg)
+
+            elif opt in ("-o", "--outfile"):
+                request['outfile'] = os.path.abspath(arg)
+
+            elif opt in ("-s", "--substring"):
+                request['substring'] = True
+
+            elif opt in ("-j", "--jobs"):
+                request['jobs'] = int(arg)
+
+            elif opt == "--no-format":
+                request['no_format'] = True
+
+            elif opt in ("-f", "--format"):
+                request['format'] = arg.lower().lstrip('.')
+                if request['format'] not in OUTPUT_FORMATS:
+                    raise ValueError(f"Unknown output format {arg}, expected one of {', '.join(OUTPUT_FORMATS)}")
+
+            elif opt in ("--split", "--status", "--shutdown"):
+                command = opt.lstrip('-')
+
+            elif opt == "--port":
+                port = int(arg)
+
+    except (getopt.GetoptError, ValueError) as e:
+        print("\n\n", str(e))
+        showusage(sys.argv[0])
+        sys.exit(2)
+
+    if command == 'split':
+        if 'infile' not in request or 'outfile' not in request:
+            print("Missing input file or output folder")
+            showusage(sys.argv[0])
+            sys.exit(2)
+        request['outfolder'] = request.pop('outfile')
+    elif command == 'translate' and ('infile' not in request or 'procfile' not in request):
+        print("Missing input file or procedures file")
+        showusage(sys.argv[0])
+        sys.exit(2)
+
+    try:
+        reply = send_request(port, command, request)
+    except OSError as ex:                           # URLError and ConnectionError too
+        print(f"Unable to reach the translation service on port {port}: {ex}")
+        sys.exit(1)
+
+    if reply.get('ok'):
+        print(json.dumps(reply))
+        sys.exit(0)
+
+    print(f"Request failed: {reply.get('error')}")
+    sys.exit(1)
+
+
+# #########################################################################
+# # MAIN
+# #########################################################################
+
+if __name__ == "__main__":
+
+    process_command_line(sys.argv[1:])
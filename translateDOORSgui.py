@@ -0,0 +1,249 @@
+"""
+ The Tkinter GUI for translateDOORSscript.py, which is run when that script is started without any options (or this
+ one is run directly). It is kept in its own module so that the translation engine never has to import Tk.
+
+ The translation itself runs in a worker thread, reporting its progress through a translateDOORSscript.ProgressQueue
+"""
+
+import queue
+import threading
+import time
+from tkinter import filedialog
+from tkinter import scrolledtext
+from tkinter import ttk
+from tkinter import *
+
+import translateDOORSscript as engine
+
+
+class Window(Frame):
+
+    help_text = """Use the buttons below to select the script file to process. 
+    This file MUST be preprocessed by Labview so that the Inspect commands are aligned within the
+    Test Steps as well as having each command on a separate row, the row numbers are processed 
+    to align with ONE DOORS identifier per test. This MUST also be in the .XLSX excel file format.
+
+    The procedures file MUST be in the .XLSX excel format
+    It expects the Identifier in Column 1, and the Procedure name in Column 2
+    The procedure names should not have any spaces 
+
+    The Logfile captures more detailed information about the process for any debug purposes
+
+    This window will show the progress, once the Process button is pressed.
+    Note: Pressing the file selection butons below take a few seconds to launch
+    """
+
+    def __init__(self, master=None):
+        TROW = 1
+        SROW = 2
+        PROW = 4
+        LROW = 5
+        BTNROW = 6
+        STATROW = 7
+
+        COL = 2
+        BTNCOL = 2
+
+        # parameters that you want to send through the Frame class.
+        Frame.__init__(self, master)
+
+        # reference to the master widget, which is the tk window
+        self.master = master
+        self.master.title("Wildcat Script Parser v1.0")
+
+        # Define Menu
+
+        menu = Menu(self.master)  # creating a menu instance
+        self.master.config(menu=menu)
+
+        file = Menu(menu)  # create the file Menu
+        file.add_command(label="Exit", command=self.menu_exit)  # adds a Exit to the menu option
+        menu.add_cascade(label="File", menu=file)  # bind the function file to Menu "File" Label
+
+        # Define Form
+
+        # Define the Labels
+
+        self.l1 = Label(self.master, text="Test Script")
+        self.l2 = Label(self.master, text="Procedures File")
+        self.l3 = Label(self.master, text="LogFile")
+
+        self.l1.grid(row=SROW)
+        self.l2.grid(row=PROW)
+        self.l3.grid(row=LROW)
+
+        # Define the Widgets
+
+        self.t_out = scrolledtext.ScrolledText (self.master, height=15, width=100, fg='grey')
+        self.t_scr = Text(self.master, width=100, height=1, font=('Ariel', 10))
+        self.t_proc = Text(self.master, height=1, width=100, font=('Ariel', 10))
+        self.t_log = Text(self.master, height=1, width=100, font=('Ariel', 10))
+
+        # Define the positioning
+        self.t_out.grid(row=TROW, column=COL)
+        self.t_scr.grid(row=SROW, column=COL, sticky=W)
+        self.t_proc.grid(row=PROW, column=COL, sticky=W)
+        self.t_log.grid(row=LROW, column=COL, sticky=W)
+        # self.t4.place (x=50,y=320)
+        # l1.place(x=50,y=300)
+
+        # Assign the widgets to procedures
+        Button(self.master, text='Script File',
+               command=self.get_script_file, width=12).grid(row=SROW, column=BTNCOL, sticky=E, pady=4)
+        Button(self.master, text='Procedure File',
+               command=self.get_procedure_file, width=12).grid(row=PROW, column=BTNCOL, sticky=E, pady=4)
+        Button(self.master, text='Logfile',
+               command=self.get_logfile, width=12).grid(row=LROW, column=BTNCOL, sticky=E, pady=4)
+        self.b_process = Button(self.master, text='Process Script', command=self.process_script, width=12)
+        self.b_process.grid(row=BTNROW, column=BTNCOL, sticky=E, padx=100)
+        self.b_cancel = Button(self.master, text='Cancel', command=self.cancel_script, width=12, state=DISABLED)
+        self.b_cancel.grid(row=BTNROW, column=BTNCOL, sticky=E)
+
+        # Progress of the translation
+        self.progress_bar = ttk.Progressbar(self.master, length=400, mode='determinate')
+        self.progress_bar.grid(row=BTNROW, column=COL, sticky=W)
+        self.l_status = Label(self.master, text="")
+        self.l_status.grid(row=STATROW, column=COL, sticky=W)
+
+        self.progress = None
+        self.started = 0.0
+        self.total_rows = 0
+
+        Button(self.master, text='Exit', command=self.menu_exit).place(x=85, y=350)
+
+        self.t_out.delete('1.0', 'end')
+        self.t_out.insert('end', self.help_text)
+
+    def get_script_file(self):
+        script_filename = filedialog.askopenfilename(initialdir="/", title="Select Script file",
+                                                     filetypes=(("Excel Files", "*.xlsx"), ("all files", "*.*")))
+        self.t_scr.delete('1.0', 'end')
+        self.t_scr.insert('end', script_filename)
+
+    def get_procedure_file(self):
+        proc_filename = filedialog.askopenfilename(initialdir="/", title="Select Procedures file",
+                                                   filetypes=(("Excel Files", "*.xlsx"), ("all files", "*.*")))
+        self.t_proc.delete('1.0', 'end')
+        self.t_proc.insert('end', proc_filename)
+
+    def get_logfile(self):
+        log_filename = filedialog.askopenfilename(initialdir="/", title="Select Logfile",
+                                                  filetypes=(("Log file", "*.txt"), ("all files", "*.*")))
+        self.t_log.delete('1.0', 'end')
+        self.t_log.insert('end', log_filename)
+
+    def menu_exit(self):
+        exit()
+
+    def process_script(self):
+
+        self.t_out.delete('1.0', 'end')
+
+        script_file = self.t_scr.get('1.0', 'end-1c')           # "end - 1c" removes \n from text
+        procedure_file = self.t_proc.get('1.0', 'end-1c')
+        logfile = self.t_log.get('1.0', 'end-1c')
+
+        self.t_out.insert('end', 'Using Script file: {}\n'.format(script_file))
+        self.t_out.insert('end', 'Using Procedure file: {}\n'.format(procedure_file))
+        self.t_out.insert('end', 'Using Logfile: {}\n'.format(logfile))
+
+        # The translation runs in a worker thread, so the window stays responsive - see poll_progress
+        self.progress = engine.ProgressQueue()
+        self.started = time.monotonic()
+        self.total_rows = 0
+        self.progress_bar['value'] = 0
+        self.l_status['text'] = ""
+        self.b_process['state'] = DISABLED
+        self.b_cancel['state'] = NORMAL
+
+        threading.Thread(target=self.run_script, args=(script_file, procedure_file, logfile, self.progress),
+                         daemon=True).start()
+        self.master.after(int(engine.PROGRESS_INTERVAL * 1000), self.poll_progress)
+
+    @staticmethod
+    def run_script(script_file: str, procedure_file: str, logfile: str, progress: engine.ProgressQueue):
+        """
+            Runs in the worker thread. It must not touch any of the widgets
+        """
+        started = time.monotonic()
+
+        try:
+            row_count = engine.run_processing_engine(script_file, procedure_file, logfile, progress)
+        except SystemExit:
+            progress.finished(0, time.monotonic() - started, "Unable to open or save the file")
+        except Exception as ex:
+            progress.finished(0, time.monotonic() - started, str(ex))
+        else:
+            progress.finished(row_count, time.monotonic() - started)
+
+    def poll_progress(self):
+        """
+            Shows any progress sent back by the worker thread, and checks again shortly, until it has finished
+        """
+        finished = False
+
+        try:
+            while True:
+                message = self.progress.messages.get_nowait()
+
+                if message[0] == 'stage':
+                    self.t_out.insert('end', message[1] + '\n')
+                    if message[2]:
+                        self.total_rows = message[2]
+                        self.progress_bar['maximum'] = self.total_rows
+
+                elif message[0] == 'rows':
+                    row_count = message[1]
+                    self.t_out.insert('end', message[2])
+                    self.progress_bar['value'] = row_count
+                    rate = row_count / max(time.monotonic() - self.started, 0.001)
+                    self.l_status['text'] = f"{row_count} of {self.total_rows} rows, {rate:.0f} rows/sec"
+
+                elif message[0] == 'finished':
+                    finished = True
+                    row_count, seconds, error = message[1:]
+
+                    if error:
+                        self.t_out.insert('end', f"\nFailed: {error}")
+                    elif self.progress.cancelled.is_set():
+                        self.t_out.insert('end', "\nCancelled - nothing has been saved")
+                    else:
+                        self.t_out.insert('end', "\nFinished")
+                        self.l_status['text'] = f"{row_count} rows in {seconds:.1f}s, " \
+                                                f"{row_count / max(seconds, 0.001):.0f} rows/sec"
+
+        except queue.Empty:
+            pass
+
+        self.t_out.see('end')
+
+        if finished:
+            self.b_process['state'] = NORMAL
+            self.b_cancel['state'] = DISABLED
+        else:
+            self.master.after(int(engine.PROGRESS_INTERVAL * 1000), self.poll_progress)
+
+    def cancel_script(self):
+        if self.progress:
+            self.progress.cancelled.set()
+            self.b_cancel['state'] = DISABLED
+
+
+def run_gui():
+    """
+        Shows the main window, and returns once it has been closed
+    """
+
+    root = Tk()
+    root.geometry("950x400")
+    app = Window(root)                                         # creation of an instance
+    root.mainloop()                                            # mainloop
+
+
+# #########################################################################
+# # MAIN
+# #########################################################################
+
+if __name__ == "__main__":
+
+    run_gui()
@@ -18,24 +18,35 @@
  Where CDNU has not been identified, the actions will default to CDNU1
 
  The Gui chosen is TKinter, purely because I needed a quick way to design a form. The code for this has been kept
- modular, so if you needed to change the GUI like Qt or Kivy, it should be very easy
+ modular, so if you needed to change the GUI like Qt or Kivy, it should be very easy. It lives in translateDOORSgui.py,
+ which is only imported when the script is run without any options - so the command line, the service and anything
+ importing this as a library never load Tk, and work where it is not installed
 
  Disclaimer: This is my first Python program, so probably there are hundreds of better ways to do this! :)
 
 """
 
 import re
+from collections import deque, OrderedDict
 from openpyxl import Workbook
 from openpyxl import load_workbook
-from openpyxl.styles import Font, Color
-from openpyxl.styles import colors
-# from word2number import w2n
+from openpyxl.styles import Font, Color, NamedStyle
+from openpyxl.cell import WriteOnlyCell
 import logging
+from logging.handlers import QueueHandler, QueueListener
 import sys
 import getopt
-from tkinter import filedialog
-from tkinter import scrolledtext
-from tkinter import *
+import glob
+import os
+import time
+import hashlib
+import json
+import csv
+import queue
+import threading
+import heapq
+import hmac
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 
 
@@ -49,17 +60,155 @@ CDNU_COL = 3
 OUTPUT_COL = 4
 ERROR_COL = 5
 
-def open_excel(xl_filename: str) -> Workbook:
+# Named styles for the CDNU, output and error columns - added to the workbook once, and then given to each cell by
+# name, which is far cheaper than giving each cell its own Font
+OUTPUT_STYLE = NamedStyle(name='DOORS Translation', font=Font(name='Calibri', size=10))
+ERROR_STYLE = NamedStyle(name='DOORS Translation Error', font=Font(name='Calibri', size=10, color='FFFF0000'))
+
+# Logging for the translation - where it goes, and at what level, is set up by setup_logging.
+# The per-row logging uses %-style arguments, so that nothing is formatted unless the level is enabled
+logger = logging.getLogger('translateDOORSscript')
+logger.addHandler(logging.NullHandler())                # nothing is logged when used as a library, unless asked for
+
+# Whether the per-row DEBUG logging is on - checked once per script, by translate_script and allocate_cdnus, so that
+# the rules only test this flag, rather than building the arguments of a logger.debug call for every row
+log_rows = False
+
+# Log levels which can be chosen with --loglevel
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+
+# Writes the queued log records to the logfile, when setup_logging is asked to use a queue
+log_listener = None
+
+# Translation rule patterns
+# Every pattern used by the process_* rules is compiled once, here, when the module is imported. Each rule starts
+# with a cheap check for its own command (e.g REC_1553) and returns straight away if the row is not one of its own,
+# so a row only pays for the full set of searches of the rule which actually matches it.
+# A pattern with several .* in a row can take quadratic or cubic time on a long row which nearly matches, as every
+# split of the row between them is tried. So where the text between two landmarks cannot itself hold the later
+# landmark (e.g the Set of an Inspect never holds a ':'), it is matched with a class or tempered token which stops
+# there - the groups found are the same, but each part of the row is only scanned once.
+# Where the pattern starts with a command followed by .* (e.g ARINC_PREFIX), a row repeating the command would still
+# be scanned again from each one by search, so those are searched with search_by_line instead.
+
+# Command dispatcher - one search classifies the row by the command it contains. The group names are the keys of
+# TRANSLATION_RULES, so the row is sent straight to the one rule which handles that command
+REC_COMMAND = re.compile(r"(?P<inspect>Inspect)|"
+                         r"(?P<test_rig>Test Rig:)|"
+                         r"(?P<bus_analyser>(?i:Bus Analyser:))|"
+                         r"(?P<power>(?i:Power\s))|"
+                         r"(?P<waitfor>^(?i:Wait ))|"
+                         r"(?P<arinc>(?i:ARINC Simulator))|"
+                         r"(?P<sim_1553>1553 Simulat)")
+
+# process_arinc
+# The Item runs up to the last 'to', so the Val never holds one, and the Bracket starts at the last ' ('
+ARINC_PREFIX = r"ARINC Simulator\s?:?\s?(?P<Set>set)"
+REC_ARINC_PREFIX = re.compile(ARINC_PREFIX, re.IGNORECASE)
+REC_ARINC = re.compile(ARINC_PREFIX + r"\s?(?P<Item>.*)to(?P<Val>(?:(?!to).)*)(?P<Bracket> \((?:(?! \().)*\))",
+                       re.IGNORECASE)
+
+# process_waitfor - the value is everything up to the first time unit, which is a number or number words
+REC_WAITFOR = re.compile(r"^Wait\s+(?=\S)(?:for\s+(?=\S))?(?:at\s+least\s+(?=\S))?(?P<Value>.*?)"
+                         r"(?<![a-z])(?P<TimeUnit>milli\s?seconds?|millisecs?|msecs?|ms|seconds?|secs?|minutes?|mins?)"
+                         r"(?![a-z])", re.IGNORECASE)
+# The time unit written out, by the start of the TimeUnit found
+WAIT_UNITS = (('mil', 'MS'), ('ms', 'MS'), ('min', 'M'), ('s', 'S'))
+
+# process_power_on_off_cdnu
+REC_POWER = re.compile(r"Power\s", re.IGNORECASE)
+REC_POWER_CDNU = re.compile(r"Power\s(?P<State>on|OFF)\s(?P<CDNU>CDNU[12])", re.IGNORECASE)
+REC_POWER_CDNUS = re.compile(r"Power\s(?P<State>on|OFF|down)\s(both|the)?\s?(?P<CDNU>CDNU'?[sS])", re.IGNORECASE)
+
+# process_bus_analyser
+REC_BUS_ANALYSER = re.compile(r"Bus Analyser:", re.IGNORECASE)
+REC_BUS_SET = re.compile(r"Bus Analyser:\s([Ss]et)\s(?P<Channel>[A-Z]{1,2}[0-9]{1,2})\s"
+                         r"(?P<Address>([A-Z]{1,2}[0-9]{1,2}))\s[Ww]ord\s"
+                         r"(?P<Word>\d{1,3})\sto\s(?P<Val>[0-9A-F]{1,8}#?[0-9A-F]{1,8})(?P<Last>.*)", re.IGNORECASE)
+REC_BUS_WORDS = re.compile(r"Bus Analyser: Set (?P<Channel>\w{3,5})\s(?P<Address>\w{3,5}) "
+                           r"words as follows:", re.IGNORECASE)
+REC_BUS_TRANSMIT = re.compile(r"Bus Analyser: Transmit the following data for (?P<Channel>\w{3,5})\s"
+                              r"(?P<Address>\w{3,5})")
+REC_BUS_WORD = re.compile(r"Word (?P<Word>\d{1,2}): (?P<WordLen>\d{1,2})#(?P<WordVal>([0-9A-F]){1,4}) "
+                          r"(?P<Last>.*)", re.IGNORECASE)
+REC_BUS_RAMP = re.compile(r"Word (?P<Word>\d{1,2}): Ramp up from (?P<WordLen1>\d{1,2})#(?P<WordVal1>([0-9A-F]){1,4}) "
+                          r"to (?P<WordLen2>\d{1,2})#(?P<WordVal2>([0-9A-F]){1,4}) in steps "
+                          r"of (?P<WordLen3>\d{1,2})#(?P<WordVal3>([0-9A-F]){1,4})(?P<Step>\d{1,2})(?P<Last>.*)",
+                          re.IGNORECASE)
+
+# process_test_rig
+TEST_RIG_PREFIX = r"Test Rig:\s[Ss]et( the)?\s"
+REC_TEST_RIG_PREFIX = re.compile(TEST_RIG_PREFIX)
+REC_TEST_RIG = re.compile(TEST_RIG_PREFIX + r"(.*) to\s(.*)")
+
+# process_inspect
+REC_INSPECT = re.compile(r"Inspect")
+# The ### is the last one, the ':' the last one before the last '=' - so neither is found again further on
+INSPECT_SET_PREFIX = r"(Inspect\(\d{1,3}\):\s+)(?P<LK>LK[0-9]) - "
+REC_INSPECT_SET_PREFIX = re.compile(INSPECT_SET_PREFIX)
+REC_INSPECT_SET = re.compile(INSPECT_SET_PREFIX + r"(.*)###((?:(?!###).)*):(?P<Set>[^:\n]*)=(?P<To>[^=\n]*)")
+INSPECT_COMMENT_PREFIX = r"Inspect\s?\(\d{1,3}\)\s?:"
+REC_INSPECT_COMMENT_PREFIX = re.compile(INSPECT_COMMENT_PREFIX)
+REC_INSPECT_COMMENT = re.compile(INSPECT_COMMENT_PREFIX + r".*(LK[0-9])\s((?:(?!LK[0-9]\s).)*)"
+                                 r"(###\s?Inspect\s?\(\d{1,3}\)\s?:\s)(.*)")
+REC_INSPECT_IS = re.compile(r"^(.*)\sis\s(.*)")
+
+# process_1553
+REC_1553 = re.compile(r"1553 Simulat")
+REC_1553_SIMULATOR = re.compile(r"1553 Simulator:")
+REC_1553_SET = re.compile(r"[Ss]et")
+REC_1553_WORDS = re.compile(r"[Ww]ords \d{1,2}")                  # Multiple words in setting
+# The last '1553 Simulat' on the line which is followed by Enable/Disable - tried from the start of each line only
+REC_1553_ENABLE = re.compile(r"(?m)^.*(1553 Simulat(?:(?!1553 Simulat).)*:)\s([Ee]nable)\s(.*)")
+REC_1553_DISABLE = re.compile(r"(?m)^.*(1553 Simulat(?:(?!1553 Simulat).)*:)\s([Dd]isable)\s(.*)")
+REC_1553_CHANNEL = re.compile(r"RT\d{1,2}")                       # Channel starts with RTnn (n= 0-9)
+REC_1553_ADDRESS = re.compile(r"SA\d{1,3}")                       # Address starts with STnnn (n = 0-9)
+REC_1553_WORD = re.compile(r"([Ww]ord|[Ww]rd) \d{1,2}")           # Word identifier starts with Word nn
+REC_1553_WORD_NUMBER = re.compile(r"\d{1,2}")
+REC_1553_TO = re.compile(r"([wW]ord|[Bb]it)? to\s([Hh]ex|[Dd]ec|[Bb]in)?([0-9A-F ]*)")  # Get 'to' value
+REC_1553_TO_NUMBER = re.compile(r"\d{1,5}")
+REC_1553_TO_GROUP = re.compile(r"[0-9A-F ]*")
+REC_1553_BASE = re.compile(r"[Hh]ex|[Dd]ec")
+REC_1553_BRACKET_PREFIX = re.compile(r"\(")
+REC_1553_BRACKET = re.compile(r"\(.+\)")                          # additional information in brackets
+
+# new_process_keywords / process_keywords
+# The CDNU keys, matched by KEY_MATCHER - the leftmost key in the row wins, and where two keys start at the same
+# place, the first in this table wins
+CDNU_KEYS = (
+    'LK0', 'LK1', 'LK2', 'LK3', 'LK4', 'LK5', 'LK6', 'LK7', 'LK8', 'LK9',
+    'ALRT', 'COM', 'DATA', 'FPLN', 'NAV', 'SNSR', 'STR', 'TEST', 'WPT', 'FWD', 'BAK', 'BCK', 'CLR', 'ENT',
+    'BRT', 'DIM', 'LL_GRID', 'HDR', 'QUIT', 'PERF', 'HUMS', 'DF', 'IFF', 'IDM', 'TAC', 'BMN', 'GODIRECT', 'ON/OFF',
+    '-->', '<--', '<<-', 'MARK', 'LBCK', 'LFWD', 'LCLR', 'LENT', 'LLK1', 'LLK2', 'LLK3', 'LLK4', 'LLK5',
+    'LRK1', 'LRK2', 'LRK3', 'LRK4', 'LRK5')
+# Keys which only match when followed by the rest of the key, given the group name used for them - MARK FIX is
+# written in many ways (MARK FIX, MARK/FIX, MARKFIX ...)
+CDNU_KEY_TAILS = {'MARK': ('MKFX', re.compile(r"\s*/*\s*FIX"))}
+REC_AS_IN = re.compile(r"[Aa]s in [Ss]ection|[Aa]s [Ss]ection|[Aa]s in ID")
+REC_ID = re.compile(r"[iI][Dd]")
+REC_ID_NUMBER = re.compile(r"[Ii][Dd].(\d{1,7})")
+
+# allocate_cdnu
+# CDNU selection - one anchored pattern, with the alternatives in order of precedence. The group matched is the
+# CDNU selected, or Actions, which starts a new test and so resets the CDNU (see allocate_cdnu)
+REC_CDNU_SELECT = re.compile(r"(?P<CDNUS>[oO]n\s[Bb]oth\sCDNU.:)"
+                             r"|(?P<CDNU1>[oO]n\sCDNU.?1.)"
+                             r"|(?P<CDNU2>[oO]n\sCDNU.?2.)"
+                             r"|(?P<Actions>Actions)")
+
+
+def open_excel(xl_filename: str, read_only: bool = False) -> Workbook:
     """
     Opens an Excel file for processing, given the pathname
     :param xl_filename:
+    :param read_only: open in openpyxl's read-only mode, for files which are only read from
     :return:  Workbook
     """
-    logging.info("open_excel")
+    logger.info("open_excel")
 
     try:
-        wbook = load_workbook(xl_filename)  # Load file
-        logging.info(f"Opened file {xl_filename}")
+        wbook = load_workbook(xl_filename, read_only=read_only)  # Load file
+        logger.info("Opened file %s", xl_filename)
         return wbook
     except FileNotFoundError:
         print(f"File {xl_filename} not found, Exiting...")
@@ -83,12 +232,12 @@ def close_excel(wbook: Workbook, xl_filename: str):
     :param xl_filename:
     :return:
     """
-    logging.info("close_excel")
+    logger.info("close_excel")
 
     try:
         wbook.save(xl_filename)
         wbook.close()
-        logging.info(f"Closed file {xl_filename}")
+        logger.info("Closed file %s", xl_filename)
     except FileNotFoundError:
         print(f"File {xl_filename} not found when Closing, Exiting...")
         exit(-1)
@@ -103,7 +252,185 @@ def close_excel(wbook: Workbook, xl_filename: str):
         exit(-1)
 
 
-def process_arinc(cell_val, cell, work_sheet):
+class ScriptRow:
+    """
+    One row of the test script, as it is translated. The process_* rules read the text and the CDNU allocation, and
+    fill in the output and error, which are only written to Excel once the row has been finished with.
+    values holds the original cells of the row, for copying to a new output file.
+    consumed is set on a row translated as part of the block of the row before it (see ScriptStream.consume_block)
+    """
+
+    __slots__ = ('row_num', 'text', 'cdnu', 'output', 'error', 'values', 'consumed')
+
+    def __init__(self, row_num: int, text: str, cdnu: str = None, values: tuple = ()):
+        self.row_num = row_num
+        self.text = text
+        self.cdnu = cdnu
+        self.output = None
+        self.error = None
+        self.values = values
+        self.consumed = False
+
+
+class ScriptStream:
+    """
+    The rows of a script, in order, as they are being translated. The rows after the current one can be looked at
+    with peek (e.g the Word rows following a Bus Analyser command) without needing random access to the file
+    """
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.ahead = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> ScriptRow:
+        if self.ahead:
+            return self.ahead.popleft()
+
+        return next(self.rows)
+
+    def peek(self, offset: int):
+        """
+        Returns the row offset rows after the current one, or None past the end of the script
+        """
+        while len(self.ahead) < offset:
+            try:
+                self.ahead.append(next(self.rows))
+            except StopIteration:
+                return None
+
+        return self.ahead[offset - 1]
+
+    def consume_block(self, *patterns):
+        """
+        Yields (row, match) for each of the rows following the current one, for as long as one of the patterns is
+        found in them - the first pattern found is the match. Rows already consumed are skipped over first.
+        Each row yielded is marked as consumed, so that it is not translated again when the stream reaches it
+        """
+        offset = 1
+
+        while self.peek(offset) is not None and self.peek(offset).consumed:
+            offset = offset + 1
+
+        while True:
+            next_row = self.peek(offset)
+
+            if next_row is None:                        # End of the script
+                return
+
+            for pattern in patterns:
+                match = pattern.search(next_row.text)
+                if match:
+                    break
+            else:
+                return
+
+            next_row.consumed = True
+            yield next_row, match
+
+            offset = offset + 1
+
+
+def read_script_rows(worksheet):
+    """
+    Generates a ScriptRow for each row of the worksheet, which can be read-only.
+    The CDNU is taken from the CDNU column - see allocate_cdnus for allocating it as the rows are read
+    """
+
+    for row_num, values in enumerate(worksheet.iter_rows(values_only=True), 1):
+        text = str(values[INPUT_COL - 1] if len(values) >= INPUT_COL else None)
+        cdnu = values[CDNU_COL - 1] if len(values) >= CDNU_COL else None
+
+        yield ScriptRow(row_num, text, cdnu, values)
+
+
+def allocate_cdnus(rows):
+    """
+    Gives each row its CDNU allocation (see allocate_cdnu) as it is read, so the script is only read once
+    """
+
+    global log_rows
+
+    last_cdnu = "CDNU1"
+    log_rows = logger.isEnabledFor(logging.DEBUG)
+
+    for row in rows:
+        cdnu_val, last_cdnu = allocate_cdnu(row.text, row.row_num, last_cdnu)
+
+        if cdnu_val is not None:
+            row.cdnu = cdnu_val
+
+        yield row
+
+
+def add_output_styles(wbook: Workbook):
+    """
+    Adds the named styles for the translated columns to the workbook, unless it already has them (e.g from an
+    earlier run on the same file)
+    """
+
+    for style in (OUTPUT_STYLE, ERROR_STYLE):
+        if style.name not in wbook.named_styles:
+            wbook.add_named_style(style)
+
+
+def write_streamed_row(out_sheet, row: ScriptRow, formatting: bool = True):
+    """
+    Appends a translated row to a write-only worksheet: the original cells, with the CDNU, output and error filled in.
+    With formatting, the filled in cells are given the named styles (see add_output_styles), otherwise they are
+    written as plain values, which is about twice as fast
+    """
+
+    out_row = list(row.values)
+
+    if len(out_row) < ERROR_COL:
+        out_row.extend([None] * (ERROR_COL - len(out_row)))
+
+    if not formatting:
+        out_row[CDNU_COL - 1] = row.cdnu
+        out_row[OUTPUT_COL - 1] = row.output
+        out_row[ERROR_COL - 1] = row.error
+        out_sheet.append(out_row)
+        return
+
+    for column, value, style in ((CDNU_COL, row.cdnu, OUTPUT_STYLE),
+                                 (OUTPUT_COL, row.output, OUTPUT_STYLE),
+                                 (ERROR_COL, row.error, ERROR_STYLE)):
+        out_cell = WriteOnlyCell(out_sheet, value=value)
+        out_cell.style = style.name
+        out_row[column - 1] = out_cell
+
+    out_sheet.append(out_row)
+
+
+def search_by_line(pattern: re.Pattern, prefix: re.Pattern, text: str):
+    """
+        Does the same as pattern.search(text), for a pattern made of the prefix, then .* (or .+, \s?.*) and the rest.
+        search tries the pattern again from each place the prefix is found, scanning the rest of the line each time.
+        But if it does not match from one prefix, it cannot match from a later one on the same line either, as the
+        .* could have taken that one in - so only the first prefix after each line break is tried
+    """
+
+    next_line = 0
+
+    for start in prefix.finditer(text):
+        if start.end() < next_line:
+            continue
+
+        found = pattern.match(text, start.start())
+        if found:
+            return found
+
+        next_line = text.find('\n', start.end())
+        if next_line < 0:
+            return None
+
+    return None
+
+
+def process_arinc(row: ScriptRow, script: ScriptStream):
 
     """
         Processes the main ARINC keywords
@@ -112,15 +439,11 @@ def process_arinc(cell_val, cell, work_sheet):
 
     global SEPCH
     global COMMENT
-    global INPUT_COL
-    global CDNU_COL
-    global OUTPUT_COL
-    global ERROR_COL
 
-    rec_arinc = re.compile("ARINC Simulator\s?:?\s?(?P<Set>set)\s?(?P<Item>.*)to(?P<Val>.*)(?P<Bracket> \(.*\))",
-                           re.IGNORECASE)
+    cell_val = row.text
+    translated = False
 
-    a1 = rec_arinc.search(cell_val)
+    a1 = search_by_line(REC_ARINC, REC_ARINC_PREFIX, cell_val)
 
     if a1:
         try:
@@ -129,7 +452,8 @@ def process_arinc(cell_val, cell, work_sheet):
             val = a1.group('Val')
             bracket = a1.group('Bracket')
         except (NameError, AttributeError):
-            logging.debug(f"{cell.row} Unable to determine sub matches for ARINC {cell_val}")
+            if log_rows:
+                logger.debug("%s Unable to determine sub matches for ARINC %s", row.row_num, cell_val)
             pass
         else:
             constructed_str = "ARINC" + SEPCH + \
@@ -140,15 +464,81 @@ def process_arinc(cell_val, cell, work_sheet):
                               COMMENT + SEPCH + \
                               str(bracket)
 
-            work_sheet.cell(row=cell.row, column=OUTPUT_COL).value = constructed_str
+            row.output = constructed_str
+            translated = True
 
             # Too many variations of the value for not enough gain - do this manually - but alert the user
-            work_sheet.cell(row=cell.row, column=ERROR_COL).value = "ALERT!"
+            row.error = "ALERT!"
+
+            if log_rows:
+                logger.debug("ARINC = %s", constructed_str)
+
+    return translated
+
+
+def number_words_table() -> dict:
+    """
+    Builds the table of number words (e.g "twenty five", "one hundred three") to their value, for 0 to 999, once.
+    The words are looked up after normalise_number_words, so hyphens and "and" need no entries of their own.
+    "a"/"an" count as one (e.g "wait a minute"), and the vague "few" and "several" as 10
+    """
+
+    units = ['zero', 'one', 'two', 'three', 'four', 'five', 'six', 'seven', 'eight', 'nine', 'ten',
+             'eleven', 'twelve', 'thirteen', 'fourteen', 'fifteen', 'sixteen', 'seventeen', 'eighteen', 'nineteen']
+    tens = ['', '', 'twenty', 'thirty', 'forty', 'fifty', 'sixty', 'seventy', 'eighty', 'ninety']
+
+    below_hundred = {}
+    for number in range(100):
+        if number < 20:
+            below_hundred[number] = units[number]
+        elif number % 10:
+            below_hundred[number] = tens[number // 10] + ' ' + units[number % 10]
+        else:
+            below_hundred[number] = tens[number // 10]
+
+    table = {words: number for number, words in below_hundred.items()}
+
+    for hundreds in range(1, 10):
+        table[units[hundreds] + ' hundred'] = hundreds * 100
+        for number in range(1, 100):
+            table[units[hundreds] + ' hundred ' + below_hundred[number]] = hundreds * 100 + number
+
+    table.update({'a': 1, 'an': 1, 'a hundred': 100, 'few': 10, 'a few': 10, 'several': 10})
+
+    return table
+
+
+NUMBER_WORDS = number_words_table()
+
+
+def normalise_number_words(value: str) -> str:
+    """
+    Puts number words into the form used by NUMBER_WORDS - lower case, hyphens as spaces, without "and"
+    """
+
+    return ' '.join(word for word in value.lower().replace('-', ' ').split() if word != 'and')
+
+
+def parse_wait_value(value: str):
+    """
+    Returns the value of a wait as a whole number, from either digits (e.g '31') or words (e.g 'thirty one'),
+    or None if it is neither. Any value mentioning "few" or "several" is taken as 10
+    """
+
+    value = value.strip()
+
+    if value.isdigit():
+        return int(value)
 
-            logging.debug(f"ARINC = {constructed_str}")
+    words = normalise_number_words(value)
 
+    if 'few' in words or 'several' in words:
+        return 10
 
-def process_waitfor(cell_val, cell, work_sheet):
+    return NUMBER_WORDS.get(words)
+
+
+def process_waitfor(row: ScriptRow, script: ScriptStream):
 
     """
         Processes the wait commands. Translates some wait commands from a string to number
@@ -158,174 +548,130 @@ def process_waitfor(cell_val, cell, work_sheet):
 
     global SEPCH
     global COMMENT
-    global INPUT_COL
-    global CDNU_COL
-    global OUTPUT_COL
-    global ERROR_COL
 
-    rec_waitfor = re.compile("^Wait (for)?(at least)? ?(?P<Value>.*)(?P<TimeUnit>second|seconds|minute|minutes)",
-                             re.IGNORECASE)
+    cell_val = row.text
+    translated = False
 
     # logging.info("In process_waitfor")
 
-    wait = rec_waitfor.search(cell_val)
+    wait = REC_WAITFOR.search(cell_val)
 
     if wait:
-        logging.debug(f"{cell.row} Wait found in {cell_val}")
-        try:
-            waitval = wait.group('Value')
-            timeunit = wait.group('TimeUnit')
-
-            # convert ambigious values for 'few' and 'several' to be 10
+        if log_rows:
+            logger.debug("%s Wait found in %s", row.row_num, cell_val)
 
-            if 'few' in waitval or 'several' in waitval:
-                waitval = 10
+        # The value is either a number (e.g '2'), or the english words for one (e.g 'two')
+        waitval = parse_wait_value(wait.group('Value'))
 
-        except (NameError, AttributeError):
-            logging.debug(f"{cell.row} Unable to determine wait time in {cell_val}")
-            pass
+        if waitval is None:
+            if log_rows:
+                logger.debug("%s Unable to determine wait time in %s", row.row_num, cell_val)
         else:
-            # Check to see if value is a number (e.g '2'), or english word of number (e.g 'two')
-            # print ("Checking word values", cell_val)
-            try:
-                intval = int(waitval)
-            except ValueError:
-                # Number is not numeric. try to convert it into a number
-                try:
-                    intnum = w2n.word_to_num(waitval)
-                except (NameError, AttributeError):
-                    logging.debug(f"{cell.row} Wait time is non-numeric {cell_val}")
-                    pass
-                else:
-                    if 'second' in timeunit.lower():
-                        unit = 'S'
-                    elif 'minute' in timeunit.lower():
-                        unit = 'M'
-                    elif ('millisec' in timeunit.lower()) or \
-                            ('ms' in timeunit.lower()):  # Unlikely but added anyway
-                        unit = 'MS'
-                    else:
-                        unit = 'UNKNOWN'
-
-                    constructed_str = "WAIT" + SEPCH + str(intnum) + SEPCH + str(unit)
-                    work_sheet.cell(row=cell.row, column=OUTPUT_COL).value = constructed_str
+            timeunit = wait.group('TimeUnit').lower()
+            unit = 'UNKNOWN'
+            for start, unit_str in WAIT_UNITS:
+                if timeunit.startswith(start):
+                    unit = unit_str
+                    break
 
-                    logging.debug(f"{cell.row} Wait for (non numeric) = {constructed_str}")
-
-            # The number was numeric - so continue processing the rest
-            else:
-                if 'second' in timeunit.lower():
-                    unit = 'S'
-                elif 'minute' in timeunit.lower():
-                    unit = 'M'
-                elif ('millisec' in timeunit.lower()) or \
-                        ('ms' in timeunit.lower()):  # Unlikely but added anyway
-                    unit = 'MS'
-                else:
-                    unit = 'UNKNOWN'
+            constructed_str = "WAIT" + SEPCH + str(waitval) + SEPCH + str(unit)
+            row.output = constructed_str
+            translated = True
 
-                constructed_str = "WAIT" + SEPCH + str(intval) + SEPCH + str(unit)
-                work_sheet.cell(row=cell.row, column=OUTPUT_COL).value = constructed_str
+            if log_rows:
+                logger.debug("%s Wait for = %s", row.row_num, constructed_str)
 
-                logging.debug(f"{cell.row}  Wait for (numeric) = {constructed_str}")
+    return translated
 
 
-def process_power_on_off_cdnu(cell_val, cell, work_sheet):
+def process_power_on_off_cdnu(row: ScriptRow, script: ScriptStream):
     """
     # Matches the power on/off/down setting
 
-    :param cell_val:
-    :param cell:
-    :param work_sheet:
+    :param row:
+    :param script:
     """
 
     global SEPCH
     global COMMENT
-    global INPUT_COL
-    global CDNU_COL
-    global OUTPUT_COL
-    global ERROR_COL
 
-    rec_cdnu = re.compile("Power\s(?P<State>on|OFF)\s(?P<CDNU>CDNU[12])", re.IGNORECASE)
-    rec_cdnus = re.compile("Power\s(?P<State>on|OFF|down)\s(both|the)?\s?(?P<CDNU>CDNU'?[sS])", re.IGNORECASE)
+    cell_val = row.text
+    translated = False
 
     # logging.info("In process_power_on_off_cdnu")
 
-    c1 = rec_cdnu.search(cell_val)
+    if not REC_POWER.search(cell_val):
+        return False
+
+    c1 = REC_POWER_CDNU.search(cell_val)
 
     if c1:
         try:
             state = c1.group('State')
             cdnu = c1.group('CDNU')
         except (NameError, AttributeError):
-            logging.debug(f"{cell.row} Cant determine Power-State or which CDNU from {cell_val}")
+            if log_rows:
+                logger.debug("%s Cant determine Power-State or which CDNU from %s", row.row_num, cell_val)
             pass
         else:
             constructed_str = "RIG" + SEPCH + "SET" + SEPCH + str(cdnu) + SEPCH + str(state).upper()
-            work_sheet.cell(row=cell.row, column=OUTPUT_COL).value = constructed_str
-            logging.debug(f"{cell.row} process_power_on_off_cdnu (match1) = {constructed_str}")
+            row.output = constructed_str
+            translated = True
+            if log_rows:
+                logger.debug("%s process_power_on_off_cdnu (match1) = %s", row.row_num, constructed_str)
 
     # This part checks for both CDNUs, so if we get a match here, it will apply to Both CDNUs
     # rather than construct a string with CDNU1 then CDNU2, I have assumed CDNUS for both, so this
     # should be available
 
-    c2 = rec_cdnus.search(cell_val)
+    c2 = REC_POWER_CDNUS.search(cell_val)
 
     if c2:
         try:
             state = c2.group('State')
         except (NameError, AttributeError):
-            logging.debug(f"{cell.row} Cant determine Power-State or which CDNU from {cell_val}")
+            if log_rows:
+                logger.debug("%s Cant determine Power-State or which CDNU from %s", row.row_num, cell_val)
             pass
         else:
             if state.lower() == "down":  # Turn 'down' to 'OFF'
                 state = "OFF"
 
             constructed_str = "RIG" + SEPCH + "SET" + SEPCH + "CDNUS" + SEPCH + str(state).upper()
-            work_sheet.cell(row=cell.row, column=OUTPUT_COL).value = constructed_str
-            logging.debug(f"{cell.row} process_power_on_off_cdnu (match2) = {constructed_str}")
+            row.output = constructed_str
+            translated = True
+            if log_rows:
+                logger.debug("%s process_power_on_off_cdnu (match2) = %s", row.row_num, constructed_str)
 
+    return translated
 
-def process_bus_analyser(cell_val, cell, work_sheet):
+
+def process_bus_analyser(row: ScriptRow, script: ScriptStream):
     """
     Processes the Bus Analyser commands.
     Any commands which set multiple values have been ignored.
     Bus Analyser: Set Squat switch to xxx
     Bus Analyser Set <Channel> to <Address> and also corresponding Word values e.g Word X to 16#FABC
     Bus Analyser Transmit <Channel> to <Address> and also corresponding Word values e.g Transmit Word X 16#FABC
+    The Word (and Ramp) rows following a Set or Transmit command are translated here, as one block, and consumed
+    from the script, so they are not translated again when the main loop reaches them
 
-    :param cell_val:
-    :param cell:
-    :param work_sheet:
+    :param row:
+    :param script:
     """
 
     global SEPCH
     global COMMENT
-    global INPUT_COL
-    global CDNU_COL
-    global OUTPUT_COL
-    global ERROR_COL
-    r_num = 0  # row number
-
-    rec_bus = re.compile("Bus Analyser:\s([Ss]et)\s(?P<Channel>[A-Z]{1,2}[0-9]{1,2})\s"
-                         "(?P<Address>([A-Z]{1,2}[0-9]{1,2}))\s[Ww]ord\s"
-                         "(?P<Word>\d{1,3})\sto\s(?P<Val>[0-9A-F]{1,8}#?[0-9A-F]{1,8})(?P<Last>.*)", re.IGNORECASE)
 
-    rec_bus1 = re.compile("Bus Analyser: Set (?P<Channel>\w{3,5})\s(?P<Address>\w{3,5}) "
-                          "words as follows:", re.IGNORECASE)
+    cell_val = row.text
+    translated = False
 
-    rec_wd = re.compile("Word (?P<Word>\d{1,2}): (?P<WordLen>\d{1,2})#(?P<WordVal>([0-9A-F]){1,4}) "
-                        "(?P<Last>.*)", re.IGNORECASE)
+    if not REC_BUS_ANALYSER.search(cell_val):
+        return False
 
-    rec_bus2 = re.compile("Bus Analyser: Transmit the following data for (?P<Channel>\w{3,5})\s(?P<Address>\w{3,5})")
-    rec_ramp = re.compile("Word (?P<Word>\d{1,2}): Ramp up from (?P<WordLen1>\d{1,2})#(?P<WordVal1>([0-9A-F]){1,4}) "
-                          "to (?P<WordLen2>\d{1,2})#(?P<WordVal2>([0-9A-F]){1,4}) in steps "
-                          "of (?P<WordLen3>\d{1,2})#(?P<WordVal3>([0-9A-F]){1,4})(?P<Step>\d{1,2})(?P<Last>.*)",
-                          re.IGNORECASE)
-
-    ba = rec_bus.search(cell_val)
-    ba1 = rec_bus1.search(cell_val)
-    ba2 = rec_bus2.search(cell_val)
+    ba = REC_BUS_SET.search(cell_val)
+    ba1 = REC_BUS_WORDS.search(cell_val)
+    ba2 = REC_BUS_TRANSMIT.search(cell_val)
 
     if ba:
         try:
@@ -335,11 +681,12 @@ def process_bus_analyser(cell_val, cell, work_sheet):
             val = ba.group('Val')
             last = ba.group('Last')
         except (NameError, AttributeError):
-            logging.debug(f"{cell.row} Cant determine Bus Analyser sub group from {cell_val}")
+            if log_rows:
+                logger.debug("%s Cant determine Bus Analyser sub group from %s", row.row_num, cell_val)
             # No match found - so just move on
             pass
         else:
-            s_cdnu = work_sheet.cell(row=cell.row, column=CDNU_COL).value
+            s_cdnu = row.cdnu
 
             constructed_str = \
                 str(s_cdnu) + SEPCH + \
@@ -350,124 +697,106 @@ def process_bus_analyser(cell_val, cell, work_sheet):
                 str(val) + SEPCH + \
                 COMMENT + str(last)
 
-            work_sheet.cell(row=cell.row, column=OUTPUT_COL).value = constructed_str
-            logging.debug(f"{cell.row} process_bus_analyser = {constructed_str}")
+            row.output = constructed_str
+            translated = True
+            if log_rows:
+                logger.debug("%s process_bus_analyser = %s", row.row_num, constructed_str)
 
     if ba1:
         try:
             ch = ba1.group('Channel')
             add = ba1.group('Address')
         except (NameError, AttributeError):
-            logging.debug(f"{cell.row} Cant determine Bus Analyser sub group 1from {cell_val}")
+            if log_rows:
+                logger.debug("%s Cant determine Bus Analyser sub group 1from %s", row.row_num, cell_val)
             # No match found - so just move on
         else:
-            # Loop through the rest of the file, until we come to something not starting with Word
-
-            while True:
-
-                r_num = r_num + 1
-                new_val = str(work_sheet.cell(row=cell.row + r_num, column=INPUT_COL).value)
-
-                try:
-                    w1 = rec_wd.search(new_val)
-                except (NameError, AttributeError):
-                    logging.debug(f"{cell.row} Breaking from Checking Word value {cell_val}")
-                    return
-                else:
-                    if w1:
-                        wd = w1.group('Word')
-                        # wlen = w1.group('WordLen') # Future use - if 32/64 bit words are used, then this can be used
-                        wval = w1.group('WordVal')
-                        last = w1.group('Last')
-
-                        constructed_str = \
-                            '1553' + SEPCH + \
-                            'SET' + SEPCH + \
-                            str(ch) + SEPCH + \
-                            str(add) + SEPCH + \
-                            str(wd) + SEPCH + \
-                            str(wval) + SEPCH +\
-                            COMMENT + str(last)
+            # The Word rows which follow make up the block
+            for next_row, w1 in script.consume_block(REC_BUS_WORD):
+                wd = w1.group('Word')
+                # wlen = w1.group('WordLen') # Future use - if 32/64 bit words are used, then this can be used
+                wval = w1.group('WordVal')
+                last = w1.group('Last')
+
+                constructed_str = \
+                    '1553' + SEPCH + \
+                    'SET' + SEPCH + \
+                    str(ch) + SEPCH + \
+                    str(add) + SEPCH + \
+                    str(wd) + SEPCH + \
+                    str(wval) + SEPCH +\
+                    COMMENT + str(last)
+
+                next_row.output = constructed_str
+                translated = True
+                if log_rows:
+                    logger.debug("%s process_bus_analyser = %s", row.row_num, constructed_str)
 
-                        work_sheet.cell(row=cell.row + r_num, column=OUTPUT_COL).value = constructed_str
-                        # print(f"{cell.row + r_num} - {constructed_str}")
-                        logging.debug(f"{cell.row} process_bus_analyser = {constructed_str}")
-                    else:
-                        break
     # Search for Bus Analyser: Transmit the following data for xxx
     if ba2:
         try:
             ch = ba2.group('Channel')
             add = ba2.group('Address')
         except (NameError, AttributeError):
-            logging.debug(f"{cell.row} Cant determine Bus Analyser sub group 2 from {cell_val}")
+            if log_rows:
+                logger.debug("%s Cant determine Bus Analyser sub group 2 from %s", row.row_num, cell_val)
             # No match found - so just move on
         else:
-            # Loop through the rest of the file, until we come to something not starting with Word or Ramp
-            while True:
+            # The Word and Ramp rows which follow make up the block
+            for next_row, word in script.consume_block(REC_BUS_WORD, REC_BUS_RAMP):
+                if word.re is REC_BUS_WORD:
+                    # w_len1 = word.group('WordLen') # Future use - if 32/64 bit words are used, then this can be used
+                    wd = word.group('Word')
+                    val = word.group('WordVal')
+                    last = word.group('Last')
 
-                r_num = r_num + 1
-                new_val = str(work_sheet.cell(row=cell.row + r_num, column=INPUT_COL).value)
+                    constructed_str = \
+                        '1553' + SEPCH + \
+                        'SET' + SEPCH + \
+                        str(ch) + SEPCH + \
+                        str(add) + SEPCH + \
+                        str(wd) + SEPCH + \
+                        str(val) + SEPCH + \
+                        COMMENT + str(last)
+
+                    next_row.output = constructed_str
+                    translated = True
+                    if log_rows:
+                        logger.debug("%s BA2 %s process_bus_analyser = %s", row.row_num, row.row_num, constructed_str)
 
-                try:
-                    w1 = rec_wd.search(new_val)
-                    w2 = rec_ramp.search(new_val)
-                except (NameError, AttributeError):
-                    logging.debug(f"{cell.row} Breaking from Checking Word Ba2 new-value {cell_val}")
                 else:
-                    if w1:
-                        # w_len1 = w1.group('WordLen') # Future use - if 32/64 bit words are used, then this can be used
-                        wd = w1.group('Word')
-                        val = w1.group('WordVal')
-                        last = w1.group('Last')
+                    # w_len1 = word.group('WordLen1') # Future use - if 32/64 bit words are used
+                    # w_len2 = word.group('WordLen2') # Future use - if 32/64 bit words are used
+                    # w_len3 = word.group('WordLen3') # Future use - if 32/64 bit words are used
+                    wd = word.group('Word')
+                    val1 = int(word.group('WordVal1'), 16)   # Convert from Hex String to int
+                    val2 = int(word.group('WordVal2'), 16)
+                    step = int(word.group('Step'))
+                    last = word.group('Last')
+
+                    constructed_str = ""
 
-                        constructed_str = \
+                    # need to loop around here for the step increment
+                    for i in range(val1, val2, step):
+
+                        constructed_str = constructed_str + \
                             '1553' + SEPCH + \
                             'SET' + SEPCH + \
                             str(ch) + SEPCH + \
                             str(add) + SEPCH + \
                             str(wd) + SEPCH + \
-                            str(val) + SEPCH + \
-                            COMMENT + str(last)
-
-                        work_sheet.cell(row=cell.row + r_num, column=OUTPUT_COL).value = constructed_str
-                        # print(f"BA2 {cell.row + r_num} - {constructed_str}")
-                        logging.debug(f"{cell.row} BA2 {cell.row} process_bus_analyser = {constructed_str}")
-
-                    elif w2:
-                        # w_len1 = w1.group('WordLen1') # Future use - if 32/64 bit words are used
-                        # w_len2 = w1.group('WordLen2') # Future use - if 32/64 bit words are used
-                        # w_len3 = w1.group('WordLen3') # Future use - if 32/64 bit words are used
-                        wd = w2.group('Word')
-                        val1 = int(w2.group('WordVal1'), 16)   # Convert from Hex String to int
-                        val2 = int(w2.group('WordVal2'), 16)
-                        step = int(w2.group('Step'))
-                        last = w2.group('Last')
-
-                        constructed_str = ""
-
-                        # need to loop around here for the step increment
-                        for i in range(val1, val2, step):
-
-                            constructed_str = constructed_str + \
-                                '1553' + SEPCH + \
-                                'SET' + SEPCH + \
-                                str(ch) + SEPCH + \
-                                str(add) + SEPCH + \
-                                str(wd) + SEPCH + \
-                                str(i) + SEPCH +\
-                                COMMENT + str(last) + "\n"
-
-                            # print(f"BA3{cell.row + r_num} - {constructed_str}")
-                            logging.debug(f"{cell.row} BA3 {cell.row} process_bus_analyser = {constructed_str}")
-
-                        work_sheet.cell(row=cell.row + r_num, column=OUTPUT_COL).value = constructed_str
+                            str(i) + SEPCH +\
+                            COMMENT + str(last) + "\n"
 
-                    else:
-                        break
+                    if log_rows:
+                        logger.debug("%s BA3 %s process_bus_analyser = %s", row.row_num, row.row_num, constructed_str)
+                    next_row.output = constructed_str
+                    translated = True
 
+    return translated
 
-def process_test_rig(cell_val, cell, work_sheet):
+
+def process_test_rig(row: ScriptRow, script: ScriptStream):
     """
         Matches Test Rig: Set Squat swtich to xxx
         Group 1 is optional junk
@@ -477,24 +806,25 @@ def process_test_rig(cell_val, cell, work_sheet):
 
     global SEPCH
     global COMMENT
-    global INPUT_COL
-    global CDNU_COL
-    global OUTPUT_COL
-    global ERROR_COL
 
-    set_to = re.search("Test Rig:\s[Ss]et( the)?\s(.*) to\s(.*)", cell_val)
+    cell_val = row.text
+    translated = False
+
+    set_to = search_by_line(REC_TEST_RIG, REC_TEST_RIG_PREFIX, cell_val)
 
     if set_to:
         try:
             switch_name = set_to.group(2)
             switch_state = set_to.group(3)
         except (NameError, AttributeError):
-            logging.debug(f"{cell.row} Cant determine Process Test Rig sub group from {cell_val}")
+            if log_rows:
+                logger.debug("%s Cant determine Process Test Rig sub group from %s", row.row_num, cell_val)
             pass
         else:
-            logging.debug(f"{cell.row} name = {switch_name} state =  {switch_state}")
+            if log_rows:
+                logger.debug("%s name = %s state =  %s", row.row_num, switch_name, switch_state)
 
-            s_cdnu = work_sheet.cell(row=cell.row, column=CDNU_COL).value
+            s_cdnu = row.cdnu
 
             constructed_str = \
                 str(s_cdnu) + SEPCH + \
@@ -503,11 +833,15 @@ def process_test_rig(cell_val, cell, work_sheet):
                 str(switch_name) + SEPCH + \
                 str(switch_state)
 
-            work_sheet.cell(row=cell.row, column=OUTPUT_COL).value = constructed_str
-            logging.debug(f"{cell.row} process_test_rig = {constructed_str}")
+            row.output = constructed_str
+            translated = True
+            if log_rows:
+                logger.debug("%s process_test_rig = %s", row.row_num, constructed_str)
+
+    return translated
 
 
-def process_inspect(cell_val, cell, work_sheet):
+def process_inspect(row: ScriptRow, script: ScriptStream):
     """
         Matches Inspect(n): LKn<something>### Inspect(n): <something3)
         Group 1 is LK key
@@ -518,36 +852,40 @@ def process_inspect(cell_val, cell, work_sheet):
 
     global SEPCH
     global COMMENT
-    global INPUT_COL
-    global CDNU_COL
-    global OUTPUT_COL
-    global ERROR_COL
 
-    rec_srch_inspect1 = re.compile("(Inspect\(\d{1,3}\):\s+)(?P<LK>LK[0-9]) - (.*)###(.*):(?P<Set>.*)=(?P<To>.*)")
-    srch_inspect1 = rec_srch_inspect1.search(cell_val)
-    srch_inspect_comment = re.search(
-            "Inspect\s?\(\d{1,3}\)\s?:.*(LK[0-9])\s(.*)(###\s?Inspect\s?\(\d{1,3}\)\s?:\s)(.*)", cell_val)
+    cell_val = row.text
+    translated = False
+
+    if not REC_INSPECT.search(cell_val):
+        return False
+
+    srch_inspect1 = search_by_line(REC_INSPECT_SET, REC_INSPECT_SET_PREFIX, cell_val)
+    srch_inspect_comment = search_by_line(REC_INSPECT_COMMENT, REC_INSPECT_COMMENT_PREFIX, cell_val)
 
     if srch_inspect_comment:
         try:
             lk_str = srch_inspect_comment.group(1)
         except (NameError, AttributeError):
-            logging.debug(f"{cell.row} Unable to get sub-groups for Inspect Comment Group 1 - {lk_str}")
+            if log_rows:
+                logger.debug("%s Unable to get sub-groups for Inspect Comment Group 1 - %s", row.row_num, lk_str)
             pass
         else:
             try:
                 set_string = str(srch_inspect_comment.group(4))
             except (NameError, AttributeError):
-                logging.debug(f"{cell.row} Unable to get sub-groups for Inspect Comment group 4 - {set_string}")
+                if log_rows:
+                    logger.debug("%s Unable to get sub-groups for Inspect Comment group 4 - %s", row.row_num,
+                                 set_string)
                 pass
             else:
                 try:
-                    srch_val = re.search("(.*)\sis\s(.*)", set_string)
+                    srch_val = REC_INSPECT_IS.search(set_string)
                     before_is = srch_val.group(1)
                     to_val = srch_val.group(2)
                     keyword = before_is.split()[-1]
                 except (NameError, AttributeError):
-                    logging.debug(f"{cell.row} Unable to get sub-groups for Inspect Comment  - {srch_val}")
+                    if log_rows:
+                        logger.debug("%s Unable to get sub-groups for Inspect Comment  - %s", row.row_num, srch_val)
                     pass
                 else:
 
@@ -559,10 +897,12 @@ def process_inspect(cell_val, cell, work_sheet):
                     if (cell_val.lower()).find(" lower ") != -1:
                         line_num = 2
 
-                    logging.debug(f"{cell.row} LK=[{lk_str}], set=[{set_string}], before_is = [{before_is}], to_val=[{to_val}], \
-                            keyword = [{keyword}], Line = [{line_num}], {cell_val}")
+                    if log_rows:
+                        logger.debug("%s LK=[%s], set=[%s], before_is = [%s], to_val=[%s], keyword = [%s], "
+                                     "Line = [%s], %s", row.row_num, lk_str, set_string, before_is, to_val, keyword,
+                                     line_num, cell_val)
 
-                    s_cdnu = work_sheet.cell(row=cell.row, column=CDNU_COL).value
+                    s_cdnu = row.cdnu
 
                     constructed_str = \
                         str(s_cdnu) + SEPCH + \
@@ -573,7 +913,8 @@ def process_inspect(cell_val, cell, work_sheet):
                         "EQUALTO" + SEPCH + \
                         str(to_val) + SEPCH + \
                         COMMENT + str(set_string)
-                    work_sheet.cell(row=cell.row, column=OUTPUT_COL).value = constructed_str
+                    row.output = constructed_str
+                    translated = True
 
     if srch_inspect1:
         try:
@@ -581,10 +922,11 @@ def process_inspect(cell_val, cell, work_sheet):
             set_val = srch_inspect1.group('Set').strip()
             to_val = srch_inspect1.group('To').strip()
         except (NameError, AttributeError):
-            logging.debug("{cell.row} Unable to get sub-groups for Inspect1")
+            if log_rows:
+                logger.debug("%s Unable to get sub-groups for Inspect1", row.row_num)
             pass
         else:
-            s_cdnu = work_sheet.cell(row=cell.row, column=CDNU_COL).value
+            s_cdnu = row.cdnu
 
             constructed_str = \
                 str(s_cdnu) + SEPCH + \
@@ -595,48 +937,194 @@ def process_inspect(cell_val, cell, work_sheet):
                 "EQUALTO" + SEPCH + \
                 str(to_val) + SEPCH
 
-            work_sheet.cell(row=cell.row, column=OUTPUT_COL).value = constructed_str
-            work_sheet.cell(row=cell.row, column=ERROR_COL).value = 'ALERT! - Check Value Range'
-            logging.debug(f"{cell.row} {constructed_str}\t\t,from {cell_val}")
+            row.output = constructed_str
+            translated = True
+            row.error = 'ALERT! - Check Value Range'
+            if log_rows:
+                logger.debug("%s %s\t\t,from %s", row.row_num, constructed_str, cell_val)
+
+    return translated
+
+
+class ProcedureIndex:
+    """
+    The procedures file, loaded once into a dictionary keyed by DOORS Id, so that each "as in ID" row is a single
+    lookup rather than a scan of the whole of Col A.
+    Where substring_match is set, an Id which is not found exactly is then searched for within the Ids in file order,
+    which is how the procedure names were originally looked up
+    """
+
+    def __init__(self, procedure_file: str, substring_match: bool = False):
+        self.procedure_file = procedure_file
+        self.substring_match = substring_match
+        self.names = {}
+
+    def add(self, doors_id, proc_name):
+        # The first entry for an Id wins, as it did when the file was scanned from the top
+        self.names.setdefault(str(doors_id).strip(), proc_name)
+
+    def find(self, id_str: str):
+        """
+        Returns (found, procedure name) for the Id
+        """
+        if id_str in self.names:
+            return True, self.names[id_str]
+
+        if self.substring_match:
+            for doors_id, proc_name in self.names.items():
+                if doors_id.find(id_str) != -1:
+                    return True, proc_name
+
+        return False, None
+
 
+def index_procedures(rows, substring_match: bool = False, source: str = "the procedures") -> ProcedureIndex:
+    """
+    Builds a ProcedureIndex from (DOORS Id, procedure name) pairs - a dict's items(), or the rows of a procedures
+    file. Rows with no Id are skipped, and a row with no name gives the "PROCEDURE NAME NOT FOUND" ALERT.
+    source is only used in the messages about Ids which are not found
+    """
+
+    procedures = ProcedureIndex(source, substring_match)
+
+    for row in rows:
+        if row and row[0] is not None:
+            procedures.add(row[0], row[PROCEDURE_COL - 1] if len(row) >= PROCEDURE_COL else None)
 
-def get_procedure_name(id_str: str, wrk_book: Workbook, procedure_file: str) -> str:
+    return procedures
+
+
+def load_procedure_index(procedure_file: str, substring_match: bool = False) -> ProcedureIndex:
     """
-    Scans through an Excel filename expecting two columns:
+    Reads the procedures file into a ProcedureIndex, expecting two columns:
     The data must be in Sheet1
     Col A has the DOORS Id where the procedure is located. This is just the absolute id, with no prefixes
     Col B has the name of the DOORS procedure name.  The spaces are replaced by underscores prior to using the file.
+    The file is only read, it is not saved back
+    """
+
+    wrk_book = open_excel(procedure_file, read_only=True)
+    wsheet = wrk_book.active
+
+    procedures = index_procedures(wsheet.iter_rows(min_col=1, max_col=PROCEDURE_COL, values_only=True),
+                                  substring_match, procedure_file)
+
+    wrk_book.close()
+    logger.info("Indexed %s procedures from %s", len(procedures.names), procedure_file)
+
+    return procedures
+
+
+def get_procedure_name(id_str: str, procedures: ProcedureIndex) -> str:
+    """
+    Looks up the procedure name for a DOORS Id in the procedures index (see load_procedure_index)
     Both Col A and Col B must be populated, although some error checking does take place.
     Where the entry cannot be found, and ALERT text is returned, which can then be searched for in the converted file
     for easy modification
     """
 
-    global ERROR_COL
-    global PROCEDURE_COL
+    found, proc_name = procedures.find(id_str)
 
-    # wrk_book = open_excel(procedure_file)
-    wsheet = wrk_book.active
-    found = False
+    if not found:
+        logger.warning("No match found for %s in %s", id_str, procedures.procedure_file)
+        return "ALERT! NO MATCH FOUND IN PROCEDURE FILE"
 
-    for cell in wsheet['A']:
-        # print (cell.value)
-        s = str(cell.value)
+    if proc_name is None:
+        logger.warning("A Corresponding Procedure Name was not found for Id: %s in %s", id_str,
+                       procedures.procedure_file)
+        return "ALERT! PROCEDURE NAME NOT FOUND"
 
-        if s.find(id_str) != -1:
-            proc_name = wsheet.cell(row=cell.row, column=PROCEDURE_COL).value
+    return proc_name
 
-            if proc_name is None:
-                print(f"A Corresponding Procedure Name was not found for Id: {id_str} in {procedure_file}")
-                return "ALERT! PROCEDURE NAME NOT FOUND"
-            else:
-                return proc_name
 
-    if not found:
-        print(f"No match found for {id_str} in {procedure_file}")
-        return "ALERT! NO MATCH FOUND IN PROCEDURE FILE"
+class KeyMatch:
+    """
+    A key found by KeyMatcher.search - group(), start() and end() work as they do for a regex match, and group(name)
+    gives the key for a key with a tail (see CDNU_KEY_TAILS), or None
+    """
+
+    __slots__ = ('key', 'name', 'text', 'begin', 'finish')
+
+    def __init__(self, key: str, name: str, text: str, begin: int, finish: int):
+        self.key = key
+        self.name = name
+        self.text = text
+        self.begin = begin
+        self.finish = finish
+
+    def group(self, name=0):
+        if name == 0 or name == self.name:
+            return self.text[self.begin:self.finish]
+
+        return None
+
+    def start(self) -> int:
+        return self.begin
+
+    def end(self) -> int:
+        return self.finish
+
+
+class KeyMatcher:
+    """
+    Finds the leftmost CDNU key in a row, from a table of keys, built once into a trie of the keys' characters.
+    The places in the row holding the first character of a key are found with a single character set, and the trie
+    is walked from each of those, so the row is scanned once however many keys there are. Where more than one key
+    starts at the same place, the first in the table wins - so the same key is found as for a regex alternation of
+    the keys in table order
+    """
+
+    def __init__(self, keys, tails: dict = None):
+        self.tails = tails or {}
+        self.trie = {}
+
+        for order, key in enumerate(keys):
+            node = self.trie
+            for char in key:
+                node = node.setdefault(char, {})
+            node.setdefault('', (order, key))                  # '' marks the end of a key
+
+        self.longest = max(len(key) for key in keys)
+
+        self.first_chars = re.compile('[' + re.escape(''.join(self.trie)) + ']')
+
+    def search(self, text: str):
+        """
+        Returns the KeyMatch of the leftmost key in the text, or None
+        """
+        for place in self.first_chars.finditer(text):
+            begin = place.start()
+            end = begin
+            node = self.trie
+            found = []
+
+            for char in text[begin:begin + self.longest]:
+                node = node.get(char)
+                if node is None:
+                    break
+                end = end + 1
+                if '' in node:
+                    found.append(node[''] + (end,))
 
+            if len(found) > 1:
+                found.sort()
 
-def process_keywords(wbk_test_script: Workbook, wbk_procedures: Workbook, xl_procedures: str):
+            for order, key, end in found:
+                if key not in self.tails:
+                    return KeyMatch(key, None, text, begin, end)
+
+                name, tail = self.tails[key]
+                tail_match = tail.match(text, end)
+                if tail_match:
+                    return KeyMatch(key, name, text, begin, tail_match.end())
+
+        return None
+
+
+KEY_MATCHER = KeyMatcher(CDNU_KEYS, CDNU_KEY_TAILS)
+
+
+def process_keywords(wbk_test_script: Workbook, procedures: ProcedureIndex):
     global SEPCH
     global COMMENT
     global INPUT_COL
@@ -646,15 +1134,6 @@ def process_keywords(wbk_test_script: Workbook, wbk_procedures: Workbook, xl_pro
 
     work_sheet = wbk_test_script.active                              # Select the active worksheet
 
-    rec_keys = re.compile(
-        "LK[0-9]|ALRT|COM|DATA|FPLN|NAV|SNSR|STR|TEST|WPT|FWD|BAK|BCK|CLR|ENT|"
-        "BRT|DIM|LL_GRID|HDR|QUIT|PERF|HUMS|DF|IFF|IDM|TAC|BMN|GODIRECT|ON/OFF|"
-        "-->|<--|<<-|(?P<MKFX>MARK\s*/*\s*FIX)|LBCK|LFWD|LCLR|LENT|LLK1|LLK2|LLK3|LLK4|LLK5|"
-        "LRK1|LRK2|LRK3|LRK4|LRK5")
-
-    rec_as_in = re.compile("[Aa]s in [Ss]ection|[Aa]s [Ss]ection|[Aa]s in ID")
-    rec_id = re.compile("[iI][Dd]")
-
     for cell in work_sheet['B']:
 
         # cellval =  wsheet.cell(row = row, column = 2).value
@@ -663,10 +1142,10 @@ def process_keywords(wbk_test_script: Workbook, wbk_procedures: Workbook, xl_pro
 
         if cellval is not None:  # Ignore blank lines
 
-            re_as_in = rec_as_in.search(cellval)
-            re_id = rec_id.search(cellval)
-            re_inspect = re.search("Inspect", cellval)
-            re_keys = rec_keys.search(cellval)
+            re_as_in = REC_AS_IN.search(cellval)
+            re_id = REC_ID.search(cellval)
+            re_inspect = REC_INSPECT.search(cellval)
+            re_keys = KEY_MATCHER.search(cellval)
 
             # Get the CDNU allocation
             s_cdnu = work_sheet.cell(row=cell.row, column=CDNU_COL).value
@@ -675,9 +1154,9 @@ def process_keywords(wbk_test_script: Workbook, wbk_procedures: Workbook, xl_pro
                 # Ignore lines with Inspect lines for now
                 pass
             elif re_as_in and re_id and not re_inspect:   # If it contains a "as in" & "id" it is probably a Procedure
-                id_val = re.search("[Ii][Dd].(\d{1,7})", cellval)
+                id_val = REC_ID_NUMBER.search(cellval)
                 id_str = str(id_val.group(1))
-                proc_name = get_procedure_name(id_str, wbk_procedures, xl_procedures)
+                proc_name = get_procedure_name(id_str, procedures)
                 work_sheet.cell(row=cell.row, column=OUTPUT_COL).value = s_cdnu + SEPCH + "PROC:" + proc_name
 
             elif re_keys:
@@ -704,110 +1183,70 @@ def process_keywords(wbk_test_script: Workbook, wbk_procedures: Workbook, xl_pro
                     work_sheet.cell(row=cell.row, column=OUTPUT_COL).value = s_construct
 
 
-def process_cdnu_allocation(wrk_book: Workbook):
+def allocate_cdnu(cellval: str, row_num: int, last_cdnu: str):
     """
-        Recognizes the current CDNU to operate on. it does this by going through the file once and
-        looking for the CDNU allocation keywords e.g On CDNU1, or on Both CDNUs etc
-        This is then used by several other processing functions
+        Works out the CDNU allocation of one row, given the CDNU in use before it - a small state machine, where
+        "On CDNU1", "On CDNU2" and "On Both CDNUs" select the CDNU, and "Actions" resets it to CDNU1.
+        Returns the value for the CDNU column (None where the column is left as it is), and the CDNU in use after it
     """
 
-    global CDNU_COL
-
-    wsheet = wrk_book.active  # Select active worksheet
-
-    last_cdnu = "CDNU1"
-
-    print("Processing CDNU Allocations...")
-
-    # for row in range (2, wsheet.max_row):
-    for cell in wsheet['B']:
-
-        # cellval =  wsheet.cell(row = row, column = 2).value
+    selection = REC_CDNU_SELECT.match(cellval)
 
-        cellval = str(cell.value)
+    # Add an '*' in the rows converted, as these will be removed in the final stage
 
-        if cellval is not None:  # Ignore blank lines
+    if selection is None:
+        if log_rows:
+            logger.debug('%s Selection = Using Default CDNU from %s:', row_num, cellval)
+        return last_cdnu, last_cdnu
 
-            cdnu1_srch = re.search("^[oO]n\sCDNU.?1.", cellval)
-            cdnu2_srch = re.search("^[oO]n\sCDNU.?2.", cellval)
-            cdnus_srch = re.search("^[oO]n\s[Bb]oth\sCDNU.:", cellval)
-            actions_srch = re.search("^Actions.*", cellval)
-
-            # Add an '*' in the rows converted, as these will be removed in the final stage
-
-            if cdnus_srch:
-                last_cdnu = "CDNUS"
-                logging.debug(f'{cell.row} CDNU Selection = {last_cdnu} from {cellval}')
-                wsheet.cell(row=cell.row, column=CDNU_COL).value = '*'
-            elif cdnu1_srch:
-                last_cdnu = "CDNU1"
-                logging.debug(f'{cell.row} CDNU Selection = {last_cdnu} from {cellval}')
-                wsheet.cell(row=cell.row, column=CDNU_COL).value = '*'
-
-            elif cdnu2_srch:
-                last_cdnu = "CDNU2"
-                logging.debug(f'{cell.row} CDNU Selection = {last_cdnu} from {cellval}')
-                wsheet.cell(row=cell.row, column=CDNU_COL).value = '*'
-
-            elif actions_srch:
-                last_cdnu = "CDNU1"
-                logging.debug(f'{cell.row} Selection = Resetting CDNU to {last_cdnu}')
-            else:
-                logging.debug(f'{cell.row} Selection = Using Default CDNU from {cellval}:')
-                wsheet.cell(row=cell.row, column=CDNU_COL).value = last_cdnu
+    if selection.lastgroup == 'Actions':
+        if log_rows:
+            logger.debug('%s Selection = Resetting CDNU to %s', row_num, "CDNU1")
+        return None, "CDNU1"
 
-    print("Finished CDNU Allocations...")
+    if log_rows:
+        logger.debug('%s CDNU Selection = %s from %s', row_num, selection.lastgroup, cellval)
+    return '*', selection.lastgroup
 
 
-def process_1553(cell_value, cell, work_sheet):
+def process_1553(row: ScriptRow, script: ScriptStream):
     """
     Processes the value of the argument cell_value against the various forms of 1553 Simulation commands
-    The output is displayed (for the time being) and also modifies the appropriate work_sheet
+    The output is displayed (for the time being) and also fills in the output of the row
     1553 Commands with multiple Set commands are ignored as there are too few to bother with at the moment
     """
 
     global SEPCH
     global COMMENT
-    global OUTPUT_COL
-    global ERROR_COL
+
+    cell_value = row.text
+    translated = False
 
     to_val = ""
     word_val = ""
     num_base = ""
     srch_to_grp = ""
 
-    rec_srch_1553 = re.compile("1553 Simulator:")
-    rec_srch_set = re.compile("[Ss]et")
-    rec_srch_words = re.compile("[Ww]ords \d{1,2}")  # Multiple words in setting
-    rec_srch_enable = re.compile(".*(1553 Simulat.*:)\s([Ee]nable)\s(.*)")
-    rec_srch_disable = re.compile(".*(1553 Simulat.*:)\s([Dd]isable)\s(.*)")
-
-    rec_srch_channel = re.compile("RT\d{1,2}")  # Channel starts with RTnn (n= 0-9)
-    rec_srch_address = re.compile("SA\d{1,3}")  # Address starts with STnnn (n = 0-9)
-    rec_srch_word = re.compile("([Ww]ord|[Ww]rd) \d{1,2}")  # Word identifier starts with Word nn
-    rec_srch_to = re.compile("([wW]ord|[Bb]it)? to\s([Hh]ex|[Dd]ec|[Bb]in)?([0-9A-F ]*)")  # Get 'to'rec_
-
-    rec_srch_to_grp = re.compile("[0-9A-F ]*")
-    rec_srch_base = re.compile("[Hh]ex|[Dd]ec")
-    rec_srch_bracket = re.compile("\(.+\)")  # additional information in brackets
+    if not REC_1553.search(cell_value):
+        return False
 
-    srch_1553 = rec_srch_1553.search(cell_value)
-    srch_set = rec_srch_set.search(cell_value)
-    srch_words = rec_srch_words.search(cell_value)
-    srch_enable = rec_srch_enable.search(cell_value)
-    srch_disable = rec_srch_disable.search(cell_value)
+    srch_1553 = REC_1553_SIMULATOR.search(cell_value)
+    srch_set = REC_1553_SET.search(cell_value)
+    srch_words = REC_1553_WORDS.search(cell_value)
+    srch_enable = REC_1553_ENABLE.search(cell_value)
+    srch_disable = REC_1553_DISABLE.search(cell_value)
 
-    srch_channel = rec_srch_channel.search(cell_value)  # Channel starts with RTnn (n= 0-9)
-    srch_address = rec_srch_address.search(cell_value)  # Address starts with STnnn (n = 0-9)
-    srch_word = rec_srch_word.search(cell_value)  # Word identifier starts with Word nn
-    srch_to = rec_srch_to.search(cell_value)  # Get
+    srch_channel = REC_1553_CHANNEL.search(cell_value)  # Channel starts with RTnn (n= 0-9)
+    srch_address = REC_1553_ADDRESS.search(cell_value)  # Address starts with STnnn (n = 0-9)
+    srch_word = REC_1553_WORD.search(cell_value)  # Word identifier starts with Word nn
+    srch_to = REC_1553_TO.search(cell_value)  # Get
 
     if srch_1553 and srch_set:
 
         if srch_to is not None:
-            srch_to_grp = re.search("\d{1,5}", srch_to.group())
+            srch_to_grp = REC_1553_TO_NUMBER.search(srch_to.group())
 
-        srch_bracket = rec_srch_bracket.search(cell_value)                # additional information in brackets
+        srch_bracket = search_by_line(REC_1553_BRACKET, REC_1553_BRACKET_PREFIX, cell_value)   # information in brackets
 
         if srch_channel:                                                # Get Channel match
             channel_val = srch_channel.group()                          # Get Actual Channel number
@@ -820,13 +1259,13 @@ def process_1553(cell_value, cell, work_sheet):
             address_val = "No ADD"
 
         if srch_word:                                                   # For single word settings
-            srch_wrd_grp = re.search("\d{1,2}", srch_word.group())      # Match the word number
+            srch_wrd_grp = REC_1553_WORD_NUMBER.search(srch_word.group())      # Match the word number
             if srch_wrd_grp:
                 word_val = srch_wrd_grp.group()                         # Get the actual number
 
         if srch_to:
-            srch_to_grp = rec_srch_to_grp.search(srch_to.group(3))
-            srch_base = rec_srch_base.search(cell_value)
+            srch_to_grp = REC_1553_TO_GROUP.search(srch_to.group(3))
+            srch_base = REC_1553_BASE.search(cell_value)
 
             if srch_to_grp:
                 to_val = srch_to_grp.group().rstrip()
@@ -854,9 +1293,11 @@ def process_1553(cell_value, cell, work_sheet):
                               to_val + SEPCH + \
                               num_base + SEPCH +\
                               COMMENT + comment_str
-            work_sheet.cell(row=cell.row, column=OUTPUT_COL).value = constructed_str
+            row.output = constructed_str
+            translated = True
 
-            logging.debug(f"{cell.row} 1553(ALL): {constructed_str}, [{cell_value}]")
+            if log_rows:
+                logger.debug("%s 1553(ALL): %s, [%s]", row.row_num, constructed_str, cell_value)
         # No Channel
         elif srch_address and srch_word and srch_word and srch_to and srch_to_grp and channel_val == "No CH":
             constructed_str = "1553:SET" + SEPCH + \
@@ -865,12 +1306,15 @@ def process_1553(cell_value, cell, work_sheet):
                               to_val + SEPCH + \
                               num_base + SEPCH +\
                               COMMENT + comment_str
-            work_sheet.cell(row=cell.row, column=OUTPUT_COL).value = constructed_str
-            work_sheet.cell(row=cell.row, column=ERROR_COL).value = "No 1553 CH"
+            row.output = constructed_str
+            translated = True
+            row.error = "No 1553 CH"
 
-            logging.debug(f"{cell.row} 1553(NO CH): {constructed_str}, [{cell_value}] ")
+            if log_rows:
+                logger.debug("%s 1553(NO CH): %s, [%s] ", row.row_num, constructed_str, cell_value)
         elif srch_words:  # Dont process multiple word settings - too few and complicated
-            logging.debug(f"{cell.row} 1553: Found Multiple word settings - Ignoring, [{cell_value}]")
+            if log_rows:
+                logger.debug("%s 1553: Found Multiple word settings - Ignoring, [%s]", row.row_num, cell_value)
         else:
             constructed_str = "1553:SET" + SEPCH + \
                               channel_val + SEPCH + \
@@ -879,39 +1323,51 @@ def process_1553(cell_value, cell, work_sheet):
                               to_val + SEPCH + \
                               num_base + SEPCH +\
                               COMMENT + comment_str
-            work_sheet.cell(row=cell.row, column=OUTPUT_COL).value = constructed_str
-            work_sheet.cell(row=cell.row, column=ERROR_COL).value = "ALERT!! - PLS CHECK"
-            logging.debug(f"{cell.row} 1553(Other Issue!!): {constructed_str}, [{cell_value}] ")
+            row.output = constructed_str
+            translated = True
+            row.error = "ALERT!! - PLS CHECK"
+            if log_rows:
+                logger.debug("%s 1553(Other Issue!!): %s, [%s] ", row.row_num, constructed_str, cell_value)
 
     if srch_disable:
         srch_disable_channel = srch_disable.group(3)
 
         if srch_disable_channel:
             constructed_str = "1553:SET" + SEPCH + srch_disable_channel + SEPCH + '0'
-            work_sheet.cell(row=cell.row, column=OUTPUT_COL).value = constructed_str
-            logging.debug(f"{cell.row} DISABLING {constructed_str}")
+            row.output = constructed_str
+            translated = True
+            if log_rows:
+                logger.debug("%s DISABLING %s", row.row_num, constructed_str)
         else:
             srch_disable_channel = "No 1553 Channel"
             constructed_str = "1553:SET" + SEPCH + srch_disable_channel + SEPCH + '0'
-            work_sheet.cell(row=cell.row, column=OUTPUT_COL).value = constructed_str
-            work_sheet.cell(row=cell.row, column=ERROR_COL).value = "NO DISABLE CH"
-            logging.debug(f"{cell.row} NO DISABLE CH {constructed_str}")
+            row.output = constructed_str
+            translated = True
+            row.error = "NO DISABLE CH"
+            if log_rows:
+                logger.debug("%s NO DISABLE CH %s", row.row_num, constructed_str)
 
     if srch_enable:
         try:
             srch_enable_channel = srch_enable.group(3)
             constructed_str = "1553:SET" + SEPCH + srch_enable_channel
-            work_sheet.cell(row=cell.row, column=OUTPUT_COL).value = constructed_str
-            logging.debug(f"{cell.row} Enabling {constructed_str}")
+            row.output = constructed_str
+            translated = True
+            if log_rows:
+                logger.debug("%s Enabling %s", row.row_num, constructed_str)
         except(NameError, AttributeError):
             srch_enable_channel = "No 1553 Channel"
             constructed_str = "1553:SET" + SEPCH + srch_enable_channel
-            work_sheet.cell(row=cell.row, column=OUTPUT_COL).value = constructed_str
-            work_sheet.cell(row=cell.row, column=ERROR_COL).value = "NO ENABLE CH"
-            logging.debug(f"{cell.row} NO ENABLE CH {constructed_str}")
+            row.output = constructed_str
+            translated = True
+            row.error = "NO ENABLE CH"
+            if log_rows:
+                logger.debug("%s NO ENABLE CH %s", row.row_num, constructed_str)
 
+    return translated
 
-def new_process_keywords(cell_value, cell, work_sheet, wbk_procedures: Workbook, xl_procedures: str):
+
+def new_process_keywords(row: ScriptRow, procedures: ProcedureIndex):
     """
         Processes the main CDNU Key keywords, e.g DATA, FPLN, LK1 etc
         There is a special consideration for Mark Fix, as the output required doesnt match the input form
@@ -919,39 +1375,33 @@ def new_process_keywords(cell_value, cell, work_sheet, wbk_procedures: Workbook,
 
     global SEPCH
     global COMMENT
-    global INPUT_COL
-    global CDNU_COL
-    global OUTPUT_COL
-    global ERROR_COL
-
-    rec_keys = re.compile(
-        "LK[0-9]|ALRT|COM|DATA|FPLN|NAV|SNSR|STR|TEST|WPT|FWD|BAK|BCK|CLR|ENT|"
-        "BRT|DIM|LL_GRID|HDR|QUIT|PERF|HUMS|DF|IFF|IDM|TAC|BMN|GODIRECT|ON/OFF|"
-        "-->|<--|<<-|(?P<MKFX>MARK\s*/*\s*FIX)|LBCK|LFWD|LCLR|LENT|LLK1|LLK2|LLK3|LLK4|LLK5|"
-        "LRK1|LRK2|LRK3|LRK4|LRK5")
 
-    rec_as_in = re.compile("[Aa]s in [Ss]ection|[Aa]s [Ss]ection|[Aa]s in ID")
-    rec_id = re.compile("[iI][Dd]")
+    cell_value = row.text
 
     if cell_value is not None:  # Ignore blank lines
 
-        re_as_in = rec_as_in.search(cell_value)
-        re_id = rec_id.search(cell_value)
-        re_inspect = re.search("Inspect", cell_value)
-        re_keys = rec_keys.search(cell_value)
+        re_as_in = REC_AS_IN.search(cell_value)
+        re_id = REC_ID.search(cell_value)
+        re_inspect = REC_INSPECT.search(cell_value)
+        re_keys = KEY_MATCHER.search(cell_value)
 
         # Get the CDNU allocation
-        s_cdnu = work_sheet.cell(row=cell.row, column=CDNU_COL).value
+        s_cdnu = row.cdnu
 
         if re_as_in and re_id and not re_inspect:  # If it contains a "as in" & "id" it is probably a Procedure
-            id_val = re.search("[Ii][Dd].(\d{1,7})", cell_value)
-            id_str = str(id_val.group(1))
-            proc_name = get_procedure_name(id_str, wbk_procedures, xl_procedures)
-            work_sheet.cell(row=cell.row, column=OUTPUT_COL).value = s_cdnu + SEPCH + "PROC:" + proc_name
+            id_val = REC_ID_NUMBER.search(cell_value)
+            if id_val is None:
+                row.output = "ALERT! PROCEDURE ID NOT FOUND"
+            elif s_cdnu is None:
+                row.output = "ALERT! CDNU NOT DETERMINED"
+            else:
+                id_str = str(id_val.group(1))
+                proc_name = get_procedure_name(id_str, procedures)
+                row.output = s_cdnu + SEPCH + "PROC:" + proc_name
 
         elif re_keys:
             if s_cdnu is None:
-                work_sheet.cell(row=cell.row, column=OUTPUT_COL).value = "ALERT! CDNU NOT DETERMINED"
+                row.output = "ALERT! CDNU NOT DETERMINED"
             else:
                 # Process special cases
                 if re_keys.group('MKFX'):
@@ -965,17 +1415,412 @@ def new_process_keywords(cell_value, cell, work_sheet, wbk_procedures: Workbook,
                                   + SEPCH + COMMENT \
                                   + cell_value[re_keys.end():]
 
-                work_sheet.cell(row=cell.row, column=OUTPUT_COL).value = s_construct
+                row.output = s_construct
 
 
-# # ############################################# Main #####################################################
-#
-# # wbook = load_workbook("e:/temp/py/x1.xlsx") ### = this works
-#
-#
-#
-# excel_script_file = "C:/temp/newragu7-newcode.xlsx"
-# excel_procedure_file = "H:/Dev/Python/TestParser/Procedures.xlsx"
+# Most seconds spent translating one row before it is given the BUDGET_ALERT (see dispatch_row) - None for no limit.
+# The rules are not interrupted, so this flags the slow rows once they have taken too long, rather than stopping them
+row_time_budget = None
+BUDGET_ALERT = "ALERT! ROW TOOK TOO LONG TO TRANSLATE"
+
+
+# Translation rule registry - the rule which handles each of the commands recognised by REC_COMMAND.
+# Each rule returns True when it has translated the row
+
+TRANSLATION_RULES = {
+    'inspect': process_inspect,
+    'test_rig': process_test_rig,
+    'bus_analyser': process_bus_analyser,
+    'power': process_power_on_off_cdnu,
+    'waitfor': process_waitfor,
+    'arinc': process_arinc,
+    'sim_1553': process_1553,
+}
+
+
+def row_over_budget(row: ScriptRow, started: float) -> bool:
+    """
+        True, with an ALERT given for the row, once more than row_time_budget seconds have been spent on it
+    """
+
+    seconds = time.perf_counter() - started
+
+    if seconds <= row_time_budget:
+        return False
+
+    row.error = f"{BUDGET_ALERT} ({seconds:.1f}s)"
+    logger.warning("%s Translation took %.1fs: %s", row.row_num, seconds, row.text[:200])
+
+    return True
+
+
+def dispatch_row(row: ScriptRow, script: ScriptStream, procedures: ProcedureIndex, profile=None):
+    """
+        Classifies the row once, using REC_COMMAND, and passes it to the rule for the command found.
+        If the rule cannot translate the row, the next command in the row (if any) is tried, and anything which
+        is not translated as a command is processed as CDNU key presses / procedures by new_process_keywords.
+        A rule searches the whole row, so it is only tried once, however often its command is repeated in the row.
+        With a RuleProfile, each rule is timed as it is run.
+        With a row_time_budget, the row is given the BUDGET_ALERT once the rules have taken it over the budget -
+        translated or not - and if it is not translated yet, no more rules are tried. This is only checked between
+        rules, as a rule (i.e a regex search) cannot be interrupted, so it flags a slow row rather than stopping it
+    """
+
+    started = time.perf_counter() if row_time_budget else None
+    tried = set()
+
+    command = REC_COMMAND.search(row.text)
+
+    while command:
+        if command.lastgroup not in tried:
+            tried.add(command.lastgroup)
+            rule = TRANSLATION_RULES[command.lastgroup]
+
+            if profile is None:
+                translated = rule(row, script)
+            else:
+                translated = profile.run(command.lastgroup, rule, row, script)
+
+            if started is not None and row_over_budget(row, started):
+                return
+
+            if translated:
+                return
+
+        command = REC_COMMAND.search(row.text, command.end())
+
+    if profile is None:
+        new_process_keywords(row, procedures)
+    else:
+        profile.run('keywords', new_process_keywords, row, procedures)
+
+    if started is not None:
+        row_over_budget(row, started)
+
+
+def translate_script(rows, procedures: ProcedureIndex, cache=None, profile=None, memo=None):
+    """
+        Translates the rows of a script (ScriptRows, with their CDNU allocated) in a single pass.
+        This is a generator - each row is given back, with its output and error filled in, once it is finished with.
+        It does not need openpyxl, so it can be used on rows from anywhere.
+        With a TranslationCache, rows translated on an earlier run are not translated again.
+        With a RuleProfile, the time spent in each rule, and the rows left untranslated or ALERTed, are recorded.
+        Rows repeated within the script are only translated once, using the TranslationMemo given (or a new one)
+    """
+
+    global log_rows
+
+    script = ScriptStream(rows)
+    log_rows = logger.isEnabledFor(logging.DEBUG)
+    block_header = None                                 # the last row not consumed - the header of any block after it
+
+    if memo is None:
+        memo = TranslationMemo()
+
+    for row in script:
+        if row.consumed:                                # translated with the Bus Analyser block it belongs to
+            if cache is not None:
+                cache.store(row, block_header)
+        else:
+            block_header = row
+
+            if cache is None or not cache.fetch(row):
+                # The BUDGET_ALERT is for how long the row took this time, so it is not reused for another row
+                if not memo.fetch(row):
+                    dispatch_row(row, script, procedures, profile)
+
+                    if not str(row.error).startswith(BUDGET_ALERT):
+                        memo.store(row)
+
+                if cache is not None and not str(row.error).startswith(BUDGET_ALERT):
+                    cache.store(row)
+
+        if profile is not None:
+            profile.count_row(row)
+
+        yield row
+
+
+def translate_rows(lines, procedures, substring_match: bool = False, cache=None, memo=None):
+    """
+        The library entry point - translates the lines of a script held in memory, with no files, no exit on errors
+        and no logging set up (attach a handler to the 'translateDOORSscript' logger to see it).
+        procedures is a ProcedureIndex, or a dict of DOORS Id to procedure name (substring_match then applies).
+        This is a generator, giving back a ScriptRow for each line, in order, with its cdnu, output and error
+        filled in - output and error are None where the line is not translated.
+        Pass a TranslationMemo to see how many lines were repeats.
+
+            for row in translate_rows(["On CDNU2:", "Press DATA key", "as in ID 1234"], {"1234": "PROC_NAME"}):
+                print(row.row_num, row.output, row.error)
+    """
+
+    if not isinstance(procedures, ProcedureIndex):
+        procedures = index_procedures(procedures.items(), substring_match)
+
+    rows = (ScriptRow(row_num, str(line)) for row_num, line in enumerate(lines, 1))
+
+    return translate_script(allocate_cdnus(rows), procedures, cache, memo=memo)
+
+
+# Slowest rows kept by a RuleProfile for each rule
+PROFILE_SLOWEST_ROWS = 5
+
+
+class RuleProfile:
+    """
+    Statistics for each translation rule (see TRANSLATION_RULES, and 'keywords' for new_process_keywords) -
+    how many rows it was called for, how many of those it translated, the time taken, and the slowest rows.
+    Also counts the rows which were left untranslated, or given an ALERT.
+    Used with --profile, to show which rules (and so which regexes) are worth speeding up
+    """
+
+    def __init__(self):
+        self.rules = {}
+        self.rows = 0
+        self.untranslated = 0
+        self.alerts = 0
+
+    def run(self, name: str, rule, row: ScriptRow, *args):
+        """
+        Runs the rule for the row, recording the time taken. Returns what the rule returns
+        """
+        stats = self.rules.get(name)
+        if stats is None:
+            stats = self.rules[name] = {'calls': 0, 'matches': 0, 'seconds': 0.0, 'slowest': []}
+
+        started = time.perf_counter()
+        translated = rule(row, *args)
+        seconds = time.perf_counter() - started
+
+        stats['calls'] = stats['calls'] + 1
+        stats['seconds'] = stats['seconds'] + seconds
+
+        # new_process_keywords does not say whether it translated the row, so check for an output
+        if translated or (translated is None and row.output is not None):
+            stats['matches'] = stats['matches'] + 1
+
+        if len(stats['slowest']) < PROFILE_SLOWEST_ROWS:
+            heapq.heappush(stats['slowest'], (seconds, row.row_num, row.text))
+        elif seconds > stats['slowest'][0][0]:
+            heapq.heapreplace(stats['slowest'], (seconds, row.row_num, row.text))
+
+        return translated
+
+    def count_row(self, row: ScriptRow):
+        self.rows = self.rows + 1
+
+        if row.output is None and row.error is None:
+            self.untranslated = self.untranslated + 1
+        elif 'ALERT' in str(row.output) or 'ALERT' in str(row.error):
+            self.alerts = self.alerts + 1
+
+    def results(self) -> dict:
+        return {
+            'rows': self.rows,
+            'untranslated': self.untranslated,
+            'alerts': self.alerts,
+            'seconds': round(sum(stats['seconds'] for stats in self.rules.values()), 4),
+            'rules': {name: {'calls': stats['calls'],
+                             'matches': stats['matches'],
+                             'seconds': round(stats['seconds'], 6),
+                             'slowest': [{'row': row_num, 'seconds': round(seconds, 6), 'text': text}
+                                         for seconds, row_num, text in sorted(stats['slowest'], reverse=True)]}
+                      for name, stats in sorted(self.rules.items(), key=lambda item: -item[1]['seconds'])}
+        }
+
+    def summary(self) -> str:
+        results = self.results()
+        lines = [f"\n{'Rule':<14}{'Calls':>10}{'Matches':>10}{'Seconds':>10}{'us/call':>10}  Slowest row"]
+
+        for name, stats in results['rules'].items():
+            per_call = stats['seconds'] * 1000000 / stats['calls'] if stats['calls'] else 0
+            slowest = stats['slowest'][0] if stats['slowest'] else None
+            lines.append(f"{name:<14}{stats['calls']:>10}{stats['matches']:>10}{stats['seconds']:>10.3f}"
+                         f"{per_call:>10.1f}  " +
+                         (f"{slowest['row']} ({slowest['seconds'] * 1000:.2f}ms)" if slowest else ""))
+
+        lines.append(f"\n{results['rows']} rows, {results['seconds']:.3f}s in the rules, {results['untranslated']} "
+                     f"not translated, {results['alerts']} with an ALERT")
+
+        return '\n'.join(lines)
+
+    def write_json(self, profile_file: str):
+        try:
+            with open(profile_file, 'w', encoding='utf-8') as profile:
+                json.dump(self.results(), profile, indent=2)
+        except OSError as ex:
+            print(f"Unable to write the profile {profile_file}: {ex}")
+            logger.error("Unable to write the profile %s: %s", profile_file, ex)
+
+
+# Most distinct (row text, CDNU) translations kept by a TranslationMemo
+MEMO_SIZE = 10000
+
+
+class TranslationMemo:
+    """
+    The translations of the rows already seen in this run, keyed by the row text and CDNU, so that a step repeated
+    through the script (e.g "Press ENT") is only translated once - the rules only look at the row itself.
+    Bus Analyser commands translate the Word rows after them too, so they are always translated.
+    The least recently used translation is dropped once there are more than size, and a size of 0 turns it off
+    """
+
+    def __init__(self, size: int = MEMO_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def fetch(self, row: ScriptRow) -> bool:
+        """
+        Fills in the output and error of the row from an earlier row with the same text and CDNU.
+        Returns False if the row must be translated
+        """
+        if not self.size or REC_BUS_ANALYSER.search(row.text):
+            return False
+
+        key = (row.text, row.cdnu)
+        entry = self.entries.get(key)
+
+        if entry is None:
+            self.misses = self.misses + 1
+            return False
+
+        self.entries.move_to_end(key)
+        self.hits = self.hits + 1
+        row.output, row.error = entry
+        return True
+
+    def store(self, row: ScriptRow):
+        if not self.size or REC_BUS_ANALYSER.search(row.text):
+            return
+
+        self.entries[(row.text, row.cdnu)] = (row.output, row.error)
+
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def summary(self) -> str:
+        looked_up = self.hits + self.misses
+        return f"Repeated rows: {self.hits} of {looked_up} rows reused an earlier translation " \
+               f"({100 * self.hits / max(looked_up, 1):.1f}%), {len(self.entries)} kept"
+
+
+class TranslationCache:
+    """
+    The translations from earlier runs, kept in a file between runs, so that only the rows which have changed since
+    (e.g between DOORS baselines) are translated again.
+    Each translation is keyed by a hash of the row text and CDNU, this file (i.e the rules) and the procedures file,
+    so changing any of them means the rows affected are translated again.
+    Bus Analyser commands, and the Word rows after them, depend on the rows around them, so they are always
+    translated, but are still checked against the last translation for the changed rows report (see key).
+    Only the translations used on this run are saved, so those orphaned by a change to the script, this file or
+    the procedures file are dropped rather than building up run after run
+    """
+
+    def __init__(self, cache_file: str, procedure_file: str, substring_match: bool = False):
+        self.cache_file = cache_file
+        self.entries = {}
+        self.used = {}
+        self.hits = 0
+        self.misses = 0
+        self.changed_rows = []
+
+        context = hashlib.sha1()
+        with open(__file__, 'rb') as rules:
+            context.update(rules.read())
+        with open(procedure_file, 'rb') as procedures:
+            context.update(procedures.read())
+        context.update(str(substring_match).encode())
+        self.context = context.hexdigest()
+
+        if os.path.exists(cache_file):
+            try:
+                with open(cache_file, encoding='utf-8') as cache:
+                    self.entries = json.load(cache)
+                logger.info("Loaded %s cached translations from %s", len(self.entries), cache_file)
+            except (OSError, ValueError) as ex:
+                logger.warning("Unable to read the cache %s, translating every row: %s", cache_file, ex)
+
+    def key(self, row: ScriptRow, block_header: ScriptRow = None) -> str:
+        """
+        A row of a block is keyed with the header of the block too, as its translation depends on it. So it is never
+        fetched for a row with the same text outside the block, nor for one under a different header
+        """
+        key = f"{self.context}\0{row.text}\0{row.cdnu}"
+
+        if block_header is not None:
+            key = key + f"\0{block_header.text}"
+
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def fetch(self, row: ScriptRow) -> bool:
+        """
+        Fills in the output and error of the row from the cache. Returns False if the row must be translated
+        """
+        if REC_BUS_ANALYSER.search(row.text):          # its block of Word rows is translated along with it
+            return False
+
+        key = self.key(row)
+        entry = self.entries.get(key)
+
+        if entry is None:
+            self.misses = self.misses + 1
+            return False
+
+        self.hits = self.hits + 1
+        self.used[key] = entry
+        row.output, row.error = entry
+        return True
+
+    def store(self, row: ScriptRow, block_header: ScriptRow = None):
+        """
+        Keeps the translation of the row, noting it as changed if it is not the same as the last one.
+        Rows consumed with a block (see ScriptStream.consume_block) are given the block_header they belong to
+        """
+        key = self.key(row, block_header)
+        entry = [row.output, row.error]
+
+        if self.entries.get(key) != entry:
+            self.changed_rows.append((row.row_num, row.text, row.cdnu, row.output, row.error))
+
+        self.entries[key] = entry
+        self.used[key] = entry
+
+    def save(self):
+        try:
+            with open(self.cache_file + '.tmp', 'w', encoding='utf-8') as cache:
+                json.dump(self.used, cache)
+            os.replace(self.cache_file + '.tmp', self.cache_file)
+            logger.info("Saved %s cached translations to %s (%s rows reused, %s rows translated, %s dropped)",
+                        len(self.used), self.cache_file, self.hits, self.misses,
+                        len(self.entries.keys() - self.used.keys()))
+        except OSError as ex:
+            print(f"Unable to save the cache {self.cache_file}: {ex}")
+            logger.error("Unable to save the cache %s: %s", self.cache_file, ex)
+
+    def write_changed_report(self, report_file: str):
+        """
+        Lists the rows whose translation changed on this run, as a .csv file
+        """
+        try:
+            with open(report_file, 'w', encoding='utf-8', newline='') as report:
+                writer = csv.writer(report)
+                writer.writerow(["Row", "Script", "CDNU", "Output", "Error"])
+                writer.writerows(self.changed_rows)
+        except OSError as ex:
+            print(f"Unable to write the changed rows report {report_file}: {ex}")
+            logger.error("Unable to write the changed rows report %s: %s", report_file, ex)
+
+
+# # ############################################# Main #####################################################
+#
+# # wbook = load_workbook("e:/temp/py/x1.xlsx") ### = this works
+#
+#
+#
+# excel_script_file = "C:/temp/newragu7-newcode.xlsx"
+# excel_procedure_file = "H:/Dev/Python/TestParser/Procedures.xlsx"
 # logf# ile = 'H:/Dev/Python/TestParser/TestScript.log'
 #
 # # Configure the Logger - change to using a config file later
@@ -1026,11 +1871,45 @@ def showusage(myname: str):
     """
 
     print(f"\nUsage:\n\tpython.exe {myname} [-i | --infile] <inputfile> "
-          f"[-o | --outfile] <outputfile> [-l | --logfile] <logfile>\n"
+          f"[-p | --procfile] <procfile> [-o | --outfile] <outputfile> [-l | --logfile] <logfile> "
+          f"[-s | --substring] [-j | --jobs] <n> [-c | --cache] <cachefile> [--changed-only <reportfile>] "
+          f"[--profile] [--profile-json <profilefile>] [-L | --loglevel] <level> [--log-queue] [--no-format] "
+          f"[--memo-size <n>] [--row-budget <seconds>]\n"
+          f"\tpython.exe {myname} [-b | --batch] <folder or pattern> [-p | --procfile] <procfile> "
+          f"[-o | --outfile] <outputfolder> [-l | --logfile] <logfile> [-j | --jobs] <n> "
+          f"[-L | --loglevel] <level> [--log-queue] [--no-format] [--row-budget <seconds>]\n"
+          f"\tpython.exe {myname} --serve [--port] <port> [-l | --logfile] <logfile> [-L | --loglevel] <level>\n"
           "\t-i or --infile   is the Input script file (expected as Excel .xlsx)\n"
+          "\t-b or --batch    translates every .xlsx script in a folder, or matching a pattern e.g \"scripts/*.xlsx\",\n"
+          "\t                 across several processes. The outfile is then the folder for the streamed results\n"
+          "\t-j or --jobs     is the number of processes for a batch (defaults to the number of CPUs). For a single\n"
+          "\t                 script, it splits the rows of the script across that many processes\n"
           "\t-p or --procfile is the Procedures index file (as Excel .xlsx)\n"
+          "\t-o or --outfile  is an optional new Output file. The script is then streamed into it, rather than\n"
+          "\t                 being loaded in full, and only the first worksheet is copied\n"
           "\t-l or --logfile  is the Logfle for Debug purposes\n"
-          "\tThe results are placed into the inputfile, which must be closed when running this process")
+          f"\t-L or --loglevel is the level of logging, one of {', '.join(LOG_LEVELS)} (defaults to DEBUG, or INFO for\n"
+          "\t                 a batch). DEBUG logs every row, which slows the translation down\n"
+          "\t--log-queue      writes the logfile from a separate thread, so the translation does not wait for it\n"
+          "\t--no-format      leaves the CDNU, output and error columns unstyled, which is quicker\n"
+          "\t--serve          runs as a service on localhost, which keeps the rules and procedures loaded between\n"
+          f"\t                 requests sent with translateClient.py. --port defaults to {SERVICE_PORT}\n"
+          "\t                 Each request must carry the token the service writes to\n"
+          f"\t                 {service_token_file('<port>')}\n"
+          "\t-s or --substring looks up procedure Ids not found exactly by searching within the Ids, as before\n"
+          "\t-c or --cache    keeps the translations in a cache file, so that on the next run only the rows which\n"
+          "\t                 have changed are translated again\n"
+          "\t--changed-only   writes a .csv report of the rows whose translation changed since the last run with\n"
+          "\t                 the same cache file\n"
+          "\t--profile        prints the calls, matches, time and slowest rows for each translation rule\n"
+          "\t--profile-json   also writes the profile to a JSON file\n"
+          f"\t--memo-size      is the number of distinct rows whose translation is kept for reuse when the same row\n"
+          f"\t                 is repeated in the script (defaults to {MEMO_SIZE}, 0 translates every row)\n"
+          "\t--row-budget     gives an ALERT to any row which takes longer than this many seconds to translate, and\n"
+          "\t                 tries no more rules on it. A rule which is running is not interrupted, so this flags\n"
+          "\t                 the slow rows, rather than stopping them\n"
+          "\tWithout an outfile, the results are placed into the inputfile, which must be closed when running "
+          "this process")
 
 
 def process_command_line(argv):
@@ -1040,12 +1919,32 @@ def process_command_line(argv):
         and then runs the processing engine
     """
 
+    global row_time_budget
+
     excel_script_file = ''
+    script_pattern = ''
     excel_procedure_file = ''
+    output_file = ''
     logfile = ''
+    substring_match = False
+    jobs = None
+    cache_file = ''
+    changed_report = ''
+    profile = None
+    profile_file = ''
+    log_level = None
+    log_queue = False
+    formatting = True
+    memo_size = MEMO_SIZE
+    serve = False
+    port = SERVICE_PORT
 
     try:
-        opts, args = getopt.getopt(argv, "hi:p:l:", ["infile=", "procfile=", "logfile="])
+        opts, args = getopt.getopt(argv, "hi:b:p:o:l:sj:c:L:", ["infile=", "batch=", "procfile=", "outfile=",
+                                                                 "logfile=", "substring", "jobs=", "cache=",
+                                                                 "changed-only=", "profile", "profile-json=",
+                                                                 "loglevel=", "log-queue", "no-format", "serve",
+                                                                 "port=", "memo-size=", "row-budget="])
 
     except getopt.GetoptError as e:
         print("\n\n", str(e))
@@ -1060,206 +1959,797 @@ def process_command_line(argv):
         elif opt in ("-i", "--infile"):
             excel_script_file = arg
 
+        elif opt in ("-b", "--batch"):
+            script_pattern = arg
+
         elif opt in ("-p", "--procfile"):
             excel_procedure_file = arg
 
+        elif opt in ("-o", "--outfile"):
+            output_file = arg
+
         elif opt in ("-l", "--logfile"):
             logfile = arg
 
+        elif opt in ("-s", "--substring"):
+            substring_match = True
+
+        elif opt in ("-j", "--jobs"):
+            try:
+                jobs = int(arg)
+            except ValueError:
+                print(f"The number of jobs must be a number, not {arg}")
+                showusage(sys.argv[0])
+                sys.exit(2)
+
+        elif opt in ("-c", "--cache"):
+            cache_file = arg
+
+        elif opt == "--changed-only":
+            changed_report = arg
+
+        elif opt == "--profile":
+            profile = RuleProfile()
 
-    if excel_script_file == '' or excel_procedure_file == '' or logfile == '':
+        elif opt == "--profile-json":
+            profile = profile or RuleProfile()
+            profile_file = arg
+
+        elif opt in ("-L", "--loglevel"):
+            try:
+                log_level = parse_log_level(arg)
+            except ValueError as e:
+                print(str(e))
+                showusage(sys.argv[0])
+                sys.exit(2)
+
+        elif opt == "--log-queue":
+            log_queue = True
+
+        elif opt == "--no-format":
+            formatting = False
+
+        elif opt == "--memo-size":
+            try:
+                memo_size = int(arg)
+            except ValueError:
+                print(f"The memo size must be a number, not {arg}")
+                showusage(sys.argv[0])
+                sys.exit(2)
+
+        elif opt == "--row-budget":
+            try:
+                row_time_budget = float(arg)
+            except ValueError:
+                print(f"The row budget must be a number of seconds, not {arg}")
+                showusage(sys.argv[0])
+                sys.exit(2)
+
+        elif opt == "--serve":
+            serve = True
+
+        elif opt == "--port":
+            try:
+                port = int(arg)
+            except ValueError:
+                print(f"The port must be a number, not {arg}")
+                showusage(sys.argv[0])
+                sys.exit(2)
+
+    if serve:
+        if logfile == '':
+            print("The service needs a logfile")
+            showusage(sys.argv[0])
+        else:
+            run_service(logfile, port, logging.INFO if log_level is None else log_level, log_queue)
+    elif changed_report and not cache_file:
+        print("A --changed-only report needs a --cache file, to compare against the last run")
+        showusage(sys.argv[0])
+    elif (excel_script_file == '' and script_pattern == '') or excel_procedure_file == '' or logfile == '':
         print ("Must supply all three inputs")
         showusage(sys.argv[0])
+    elif script_pattern:
+        print("\nProcessing batch using following")
+        print(f"Scripts         = {script_pattern}")
+        print(f"Procedures file = {excel_procedure_file}")
+        if output_file:
+            print(f"Output folder   = {output_file}")
+        print(f"logfile file    = {logfile}")
+
+        if not translate_batch(script_pattern, excel_procedure_file, logfile, output_file, substring_match, jobs,
+                               logging.INFO if log_level is None else log_level, log_queue, formatting):
+            print(f"\n\nLogging information captured in {logfile}")
+            sys.exit(1)
+
+        print(f"\n\nLogging information captured in {logfile}")
     else:
         print("\nProcessing script using following")
         print(f"Input file      = {excel_script_file}")
         print(f"Procedures file = {excel_procedure_file}")
+        if output_file:
+            print(f"Output file     = {output_file}")
+        if cache_file:
+            print(f"Cache file      = {cache_file}")
         print(f"logfile file    = {logfile}")
 
-        run_processing_engine(excel_script_file, excel_procedure_file, logfile, False)
+        memo = TranslationMemo(memo_size)
+
+        run_processing_engine(excel_script_file, excel_procedure_file, logfile, None, substring_match, output_file,
+                              jobs or 1, cache_file, changed_report, profile,
+                              logging.DEBUG if log_level is None else log_level, log_queue, formatting, memo)
+
+        if memo.hits or memo.misses:
+            print(memo.summary())
+
+        if changed_report:
+            print(f"Changed rows written to {changed_report}")
+
+        if profile:
+            print(profile.summary())
+
+            if profile_file:
+                profile.write_json(profile_file)
+                print(f"Profile written to {profile_file}")
 
         print(f"\n\nLogging information captured in {logfile}")
 
 
-def run_processing_engine(script_file: str, procedure_file: str, logfile: str, with_gui: bool):
+def setup_logging(logfile: str, mode: str = 'w', level: int = logging.DEBUG, use_queue: bool = False):
+    """
+        Sends the logging to the logfile, at the given level. Batch workers use mode 'a', to add to the log started
+        by the batch. With use_queue, the translation only puts the log records on a queue, and they are written to
+        the logfile by a QueueListener thread - see stop_logging
+    """
+
+    global log_listener
+
+    if logging.getLogger().handlers:                          # Already set up, e.g by an earlier run from the GUI
+        return
+
+    file_handler = logging.FileHandler(logfile, mode, 'utf-8')
+    file_handler.setFormatter(logging.Formatter(fmt='%(asctime)s - %(levelname)-10s - %(message)s',
+                                                datefmt='%d-%b-%y %H:%M:%S'))
+
+    if use_queue:
+        log_queue = queue.SimpleQueue()
+        queue_handler = QueueHandler(log_queue)
+        queue_handler.setFormatter(logging.Formatter())        # Only the message - the listener adds the rest
+        log_listener = QueueListener(log_queue, file_handler)
+        log_listener.start()
+        logging.basicConfig(handlers=[queue_handler], level=level)
+    else:
+        logging.basicConfig(handlers=[file_handler], level=level)
+
+
+def stop_logging():
+    """
+        Writes out any log records still queued (see setup_logging), and stops the QueueListener thread
+    """
+
+    global log_listener
+
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+
+
+def parse_log_level(level_name: str) -> int:
+    """
+        Converts a --loglevel such as INFO to the logging level. Raises ValueError if it is not one of LOG_LEVELS
+    """
+
+    if level_name.upper() not in LOG_LEVELS:
+        raise ValueError(f"The log level must be one of {', '.join(LOG_LEVELS)}, not {level_name}")
+
+    return getattr(logging, level_name.upper())
+
+
+def run_processing_engine(script_file: str, procedure_file: str, logfile: str, progress,
+                          substring_match: bool = False, output_file: str = '', jobs: int = 1,
+                          cache_file: str = '', changed_report: str = '', profile: RuleProfile = None,
+                          log_level: int = logging.DEBUG, log_queue: bool = False, formatting: bool = True,
+                          memo: TranslationMemo = None):
+    """
+        Translates the script file, using the procedures file.
+        Without an output_file, the whole script is loaded, and the results are placed back into the script file.
+        With an output_file, the script is streamed: rows are read with a read-only workbook, translated, and
+        written straight out to a new write-only workbook, so memory use stays flat whatever the script size.
+        With a cache_file, the rows translated on an earlier run are reused (see TranslationCache), and the rows
+        whose translation changed can be listed in the changed_report.
+        progress is a ProgressQueue when run from the GUI, otherwise None.
+        With a RuleProfile, the statistics for each translation rule are recorded in it.
+        The logfile is written at log_level - DEBUG logs every row, which slows the translation down.
+        Without formatting, the translated columns are not styled, which is quicker.
+        The memo (see TranslationMemo) is where the repeated rows are counted
+    """
+
+    if memo is None:
+        memo = TranslationMemo()
 
     # Setup the Logfile
-    logging.basicConfig(handlers=[ logging.FileHandler(logfile, 'w', 'utf-8')],
-                        level=logging.DEBUG,
-                        format='%(asctime)s - %(levelname)-10s - %(message)s',
-                        datefmt='%d-%b-%y %H:%M:%S')
+    setup_logging(logfile, 'w', log_level, log_queue)
 
-    # Open the Excel file_names
-    wb_script = open_excel(script_file)
-    wb_procedures = open_excel(procedure_file)
+    try:
+        # Open the Excel file_names
+        procedures = load_procedure_index(procedure_file, substring_match)
 
-    # Process
+        cache = TranslationCache(cache_file, procedure_file, substring_match) if cache_file else None
 
-    if with_gui:
-        app.t_out.insert('end', "Processing CDNU Allocations..\n")
-        app.update_idletasks()
+        row_count = translate_script_file(script_file, procedures, progress, output_file, jobs, cache, profile,
+                                          formatting, memo)
+        logger.info(memo.summary())
 
-    process_cdnu_allocation(wb_script)                                  # figure out the CDNU for each command
-    worksheet = wb_script.active                                        # Select active worksheet
+        if cache is not None and not (progress and progress.cancelled.is_set()):
+            cache.save()
 
-    if with_gui:
-        app.t_out.insert('end', "Processing Script...\n")
-        app.update_idletasks()
+            if changed_report:
+                cache.write_changed_report(changed_report)
 
-    # for row in range (2, wsheet.max_row):
-    for cell in worksheet['B']:
-        # cellval =  wsheet.cell(row = row, column = 2).value
-        cell_val = str(cell.value)
-
-        if with_gui:
-            cell_lf = cell_val + '\n'
-            app.t_out.insert('end', cell_lf)
-            app.t_out.see('end')
-            app.update_idletasks()
-
-        process_inspect(cell_val, cell, worksheet)
-        process_test_rig(cell_val, cell, worksheet)
-        process_bus_analyser(cell_val, cell, worksheet)
-        process_power_on_off_cdnu(cell_val, cell, worksheet)
-        process_waitfor(cell_val, cell, worksheet)
-        process_arinc(cell_val, cell, worksheet)
-        process_1553(cell_val, cell, worksheet)
-        new_process_keywords(cell_val, cell, worksheet, wb_procedures, procedure_file)
-
-    # format the output column(s) as desired
-    for r in range(2, worksheet.max_row):
-        worksheet.cell(row=r, column=CDNU_COL).font = Font(name='Calibri', size=10)
-        worksheet.cell(row=r, column=OUTPUT_COL).font = Font(name='Calibri', size=10)
-        worksheet.cell(row=r, column=ERROR_COL).font = Font(name='Calibri', size=10, color = colors.RED )
+        if profile is not None and logger.isEnabledFor(logging.INFO):
+            logger.info(profile.summary())
+
+        return row_count
+    finally:
+        stop_logging()
+
+
+def translate_script_file(script_file: str, procedures: ProcedureIndex, progress=None,
+                          output_file: str = '', jobs: int = 1, cache: TranslationCache = None,
+                          profile: RuleProfile = None, formatting: bool = True,
+                          memo: TranslationMemo = None) -> int:
+    """
+        Translates one script file with an already loaded procedures index (see run_processing_engine).
+        With more than one job, the rows are translated in chunks across that many processes, which means the
+        whole script is held in memory, even when it is streamed. With a cache, only the rows not in the cache
+        are translated, and with a profile, each rule is timed - both in this process.
+        With a ProgressQueue, the progress is sent back to the GUI, and the translation stops (without saving
+        anything) if it is cancelled.
+        Without formatting, the CDNU, output and error columns are left in the default style, which is quicker.
+        The memo counts the repeated rows (each worker process has its own, with more than one job).
+        Returns the number of rows translated
+    """
+
+    row_count = 0
+
+    if output_file:
+        wb_script = open_excel(script_file, read_only=True)
+        wb_output = Workbook(write_only=True)
+        out_sheet = wb_output.create_sheet(wb_script.active.title)
+        if formatting:
+            add_output_styles(wb_output)
+    else:
+        wb_script = open_excel(script_file)
+        worksheet = wb_script.active                                    # Select active worksheet
+
+    rows = allocate_cdnus(read_script_rows(wb_script.active))          # CDNU allocated as each row is read
+
+    if progress:
+        progress.stage("Processing Script...", wb_script.active.max_row)
+
+    if jobs > 1 and cache is None and profile is None:
+        translated_rows = translate_script_parallel(rows, procedures, jobs)
+    else:
+        translated_rows = translate_script(rows, procedures, cache, profile, memo)
+
+    for row in translated_rows:
+        row_count = row_count + 1
 
+        if progress:
+            if progress.cancelled.is_set():
+                logger.info("Translation of %s cancelled at row %s, nothing saved", script_file, row.row_num)
+                wb_script.close()
+                return row_count
+
+            progress.row(row_count, row.text)
+
+        # Each row is only written to Excel once it has been translated
+        if output_file:
+            write_streamed_row(out_sheet, row, formatting)
+        else:
+            worksheet.cell(row=row.row_num, column=CDNU_COL).value = row.cdnu
+            worksheet.cell(row=row.row_num, column=OUTPUT_COL).value = row.output
+            worksheet.cell(row=row.row_num, column=ERROR_COL).value = row.error
+
+    if progress:
+        progress.flush(row_count)
+
+    if output_file:
+        # The rows have already been formatted as they were written
+        close_excel(wb_output, output_file)
+        wb_script.close()
+        return row_count
+
+    # format the output column(s) as desired, on every row after the heading
+    if formatting:
+        add_output_styles(wb_script)
+
+        for cdnu_cell, output_cell, error_cell in worksheet.iter_rows(min_row=2, min_col=CDNU_COL,
+                                                                      max_col=ERROR_COL):
+            cdnu_cell.style = OUTPUT_STYLE.name
+            output_cell.style = OUTPUT_STYLE.name
+            error_cell.style = ERROR_STYLE.name
 
     # Close Filenames
     close_excel(wb_script, script_file)
-    close_excel(wb_procedures, procedure_file)
 
+    return row_count
+
+
+# Procedures index for the worker processes (see translate_batch and translate_script_parallel) - built once,
+# and handed to each worker when it starts
+worker_procedures = None
+
+# Fewest rows worth sending to a worker process as one chunk of a script
+MIN_CHUNK_ROWS = 500
+
+
+def find_script_files(script_pattern: str) -> list:
+    """
+        The script files for a batch - every .xlsx file in a folder, or the files matching a glob pattern
+    """
+
+    if os.path.isdir(script_pattern):
+        script_pattern = os.path.join(script_pattern, '*.xlsx')
+
+    # Ignore the lock files Excel leaves beside open files
+    return sorted(f for f in glob.glob(script_pattern) if not os.path.basename(f).startswith('~$'))
+
+
+def init_worker(procedures: ProcedureIndex, logfile: str, log_level: int = logging.DEBUG, budget: float = None):
+    """
+        Runs once in each worker process. Any logging set up inherited from the parent process is replaced, as a
+        log queue is not shared with the worker processes. The row_time_budget is passed on too
+    """
+
+    global worker_procedures
+    global row_time_budget
+
+    worker_procedures = procedures
+    row_time_budget = budget
+
+    for handler in logging.getLogger().handlers[:]:
+        logging.getLogger().removeHandler(handler)
+
+    if logfile:
+        setup_logging(logfile, 'a', log_level)
+
+
+def current_logfile() -> str:
+    """
+        The logfile set up by setup_logging, for the worker processes to add to
+    """
+
+    handlers = logging.getLogger().handlers + (list(log_listener.handlers) if log_listener else [])
+
+    for handler in handlers:
+        if isinstance(handler, logging.FileHandler):
+            return handler.baseFilename
+
+    return ''
+
+
+def find_chunk_starts(rows: list, chunk_size: int) -> list:
+    """
+        Splits the rows of a script into chunks of about chunk_size rows, which can be translated independently
+        once the CDNU allocation is known. A chunk never starts on a Word or Ramp row, so that a Bus Analyser
+        command and the word rows which follow it are always in the same chunk.
+        Returns the index of the first row of each chunk
+    """
+
+    starts = [0]
+    next_start = chunk_size
+
+    while next_start < len(rows):
+        while next_start < len(rows) and (REC_BUS_WORD.search(rows[next_start].text) or
+                                          REC_BUS_RAMP.search(rows[next_start].text)):
+            next_start = next_start + 1
+
+        if next_start < len(rows):
+            starts.append(next_start)
+
+        next_start = next_start + chunk_size
+
+    return starts
+
+
+def translate_chunk(chunk: list) -> list:
+    """
+        Translates one chunk of a script in a worker process. Only the (row number, text, CDNU) of each row are
+        sent to the worker, and only the (output, error) of each row are sent back
+    """
+
+    rows = [ScriptRow(row_num, text, cdnu) for row_num, text, cdnu in chunk]
+
+    return [(row.output, row.error) for row in translate_script(rows, worker_procedures)]
+
+
+def translate_script_parallel(rows, procedures: ProcedureIndex, jobs: int):
+    """
+        Does the same as translate_script, but splits the script into chunks of rows which are translated across
+        jobs worker processes. The rows must already have their CDNU allocated, as that is the only state carried
+        from one row to the next. The results are merged back, and the rows given back, in row order
+    """
+
+    rows = list(rows)
+    starts = find_chunk_starts(rows, max(MIN_CHUNK_ROWS, len(rows) // (jobs * 4) + 1))
+    ends = starts[1:] + [len(rows)]
+
+    chunks = [[(row.row_num, row.text, row.cdnu) for row in rows[start:end]] for start, end in zip(starts, ends)]
+
+    logger.info("Translating %s rows in %s chunks across %s processes", len(rows), len(chunks), jobs)
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                             initargs=(procedures, current_logfile(), logging.getLogger().level,
+                                       row_time_budget)) as pool:
+        for start, results in zip(starts, pool.map(translate_chunk, chunks)):
+            for row, (output, error) in zip(rows[start:], results):
+                row.output = output
+                row.error = error
+                yield row
+
+
+def translate_batch_file(script_file: str, output_file: str, formatting: bool = True):
+    """
+        Translates one file of a batch, in a worker process.
+        Returns (script file, number of rows, time taken, error message - empty if successful)
+    """
+
+    start = time.perf_counter()
+
+    try:
+        row_count = translate_script_file(script_file, worker_procedures, None, output_file,
+                                          formatting=formatting)
+    except SystemExit:                              # open_excel/close_excel have already printed the reason
+        return script_file, 0, time.perf_counter() - start, "Unable to open or save the file"
+    except Exception as ex:
+        return script_file, 0, time.perf_counter() - start, str(ex)
+
+    return script_file, row_count, time.perf_counter() - start, ''
+
+
+def batch_output_files(script_files: list, output_folder: str):
+    """
+        The output file for each script of a batch - a file of the same name in the output_folder, or '' to put the
+        results back into the script. Returns None, having listed them, if scripts from different folders have the
+        same name, as they would overwrite each other in the output_folder
+    """
+
+    if not output_folder:
+        return [''] * len(script_files)
+
+    output_files = [os.path.join(output_folder, os.path.basename(script_file)) for script_file in script_files]
+    scripts_by_output = {}
+
+    for script_file, output_file in zip(script_files, output_files):
+        scripts_by_output.setdefault(os.path.normcase(output_file), []).append(script_file)
 
-class Window(Frame):
+    clashes = [scripts for scripts in scripts_by_output.values() if len(scripts) > 1]
 
-    help_text = """Use the buttons below to select the script file to process. 
-    This file MUST be preprocessed by Labview so that the Inspect commands are aligned within the
-    Test Steps as well as having each command on a separate row, the row numbers are processed 
-    to align with ONE DOORS identifier per test. This MUST also be in the .XLSX excel file format.
+    if clashes:
+        print(f"Scripts with the same name would overwrite each other in {output_folder}:")
+        for scripts in clashes:
+            print(f"\t{', '.join(scripts)}")
+        return None
 
-    The procedures file MUST be in the .XLSX excel format
-    It expects the Identifier in Column 1, and the Procedure name in Column 2
-    The procedure names should not have any spaces 
+    return output_files
 
-    The Logfile captures more detailed information about the process for any debug purposes
 
-    This window will show the progress, once the Process button is pressed.
-    Note: Pressing the file selection butons below take a few seconds to launch
+def translate_batch(script_pattern: str, procedure_file: str, logfile: str, output_folder: str = '',
+                    substring_match: bool = False, jobs: int = None, log_level: int = logging.INFO,
+                    log_queue: bool = False, formatting: bool = True) -> bool:
     """
+        Translates all the scripts in a folder (or matching a glob pattern) across a pool of worker processes.
+        The procedures file is only read once, and shared with the workers.
+        Without an output_folder, the results are placed back into each script file, otherwise each script is
+        streamed into a file of the same name in the output_folder.
+        The logging defaults to INFO, as logging every row of every script at DEBUG slows the batch right down.
+        Returns True if all the scripts were translated
+    """
+
+    setup_logging(logfile, 'w', log_level, log_queue)
+
+    try:
+        script_files = find_script_files(script_pattern)
+
+        if not script_files:
+            print(f"No script files found in {script_pattern}")
+            return False
+
+        output_files = batch_output_files(script_files, output_folder)
+
+        if output_files is None:
+            return False
 
-    def __init__(self, master=None):
-        TROW = 1
-        SROW = 2
-        PROW = 4
-        LROW = 5
-        BTNROW = 6
+        if output_folder and not os.path.exists(output_folder):
+            try:
+                os.mkdir(output_folder)
+            except Exception as e:
+                print("Unable to create diretory..", str(e))
+                return False
+
+        start = time.perf_counter()
+        procedures = load_procedure_index(procedure_file, substring_match)
+        failed = 0
+
+        print(f"Translating {len(script_files)} scripts...")
+
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                                 initargs=(procedures, logfile, log_level, row_time_budget)) as pool:
+            futures = []
+
+            for script_file, output_file in zip(script_files, output_files):
+                futures.append(pool.submit(translate_batch_file, script_file, output_file, formatting))
 
-        COL = 2
-        BTNCOL = 2
+            for future in as_completed(futures):
+                script_file, row_count, seconds, error = future.result()
 
-        # parameters that you want to send through the Frame class.
-        Frame.__init__(self, master)
+                if error:
+                    failed = failed + 1
+                    print(f"FAILED  {script_file} ({seconds:.1f}s) - {error}")
+                    logger.error("Batch: %s failed - %s", script_file, error)
+                else:
+                    print(f"OK      {script_file} - {row_count} rows ({seconds:.1f}s)")
+                    logger.info("Batch: %s translated %s rows in %.1fs", script_file, row_count, seconds)
 
-        # reference to the master widget, which is the tk window
-        self.master = master
-        self.master.title("Wildcat Script Parser v1.0")
+        print(f"\n{len(script_files) - failed} of {len(script_files)} scripts translated, {failed} failed, "
+              f"in {time.perf_counter() - start:.1f}s")
 
-        # Define Menu
+        return failed == 0
+    finally:
+        stop_logging()
 
-        menu = Menu(self.master)  # creating a menu instance
-        self.master.config(menu=menu)
 
-        file = Menu(menu)  # create the file Menu
-        file.add_command(label="Exit", command=self.menu_exit)  # adds a Exit to the menu option
-        menu.add_cascade(label="File", menu=file)  # bind the function file to Menu "File" Label
+# Port the translation service listens on, on localhost only (see run_service and translateClient.py)
+SERVICE_PORT = 8765
 
-        # Define Form
+# Header holding the service token, which every request must send (see service_token_file)
+SERVICE_TOKEN_HEADER = 'X-Service-Token'
 
-        # Define the Labels
 
-        self.l1 = Label(self.master, text="Test Script")
-        self.l2 = Label(self.master, text="Procedures File")
-        self.l3 = Label(self.master, text="LogFile")
+def service_token_file(port: int) -> str:
+    """
+        The file in the user's home folder where the service started on the port keeps its token, readable only by
+        that user - so only they can send it requests (translateClient.py reads the token from the same file)
+    """
 
-        self.l1.grid(row=SROW)
-        self.l2.grid(row=PROW)
-        self.l3.grid(row=LROW)
+    return os.path.join(os.path.expanduser('~'), f".translateDOORSscript-{port}.token")
 
-        # Define the Widgets
 
-        self.t_out = scrolledtext.ScrolledText (self.master, height=15, width=100, fg='grey')
-        self.t_scr = Text(self.master, width=100, height=1, font=('Ariel', 10))
-        self.t_proc = Text(self.master, height=1, width=100, font=('Ariel', 10))
-        self.t_log = Text(self.master, height=1, width=100, font=('Ariel', 10))
+def write_service_token(token_file: str) -> str:
+    """
+        Makes a new token for the service, and writes it to the token file. Returns the token
+    """
 
-        # Define the positioning
-        self.t_out.grid(row=TROW, column=COL)
-        self.t_scr.grid(row=SROW, column=COL, sticky=W)
-        self.t_proc.grid(row=PROW, column=COL, sticky=W)
-        self.t_log.grid(row=LROW, column=COL, sticky=W)
-        # self.t4.place (x=50,y=320)
-        # l1.place(x=50,y=300)
+    token = os.urandom(16).hex()
 
-        # Assign the widgets to procedures
-        Button(self.master, text='Script File',
-               command=self.get_script_file, width=12).grid(row=SROW, column=BTNCOL, sticky=E, pady=4)
-        Button(self.master, text='Procedure File',
-               command=self.get_procedure_file, width=12).grid(row=PROW, column=BTNCOL, sticky=E, pady=4)
-        Button(self.master, text='Logfile',
-               command=self.get_logfile, width=12).grid(row=LROW, column=BTNCOL, sticky=E, pady=4)
-        Button(self.master, text='Process Script',
-               command=self.process_script, width=12).grid(row=BTNROW, column=BTNCOL, sticky=E, padx=100)
+    descriptor = os.open(token_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, 'w') as token_out:
+        token_out.write(token)
+    os.chmod(token_file, 0o600)                         # in case the file was already there
+
+    return token
+
+
+class TranslationService:
+    """
+    Handles the requests sent to the translation service. The rules are compiled once, when the module is imported,
+    and each procedures file is only indexed again when it changes, so a request only pays for the translation
+    """
+
+    def __init__(self):
+        self.procedure_indexes = {}
+        self.requests = 0
+        self.started = time.perf_counter()
+
+    def procedures(self, procedure_file: str, substring_match: bool) -> ProcedureIndex:
+        """
+            The index of the procedures file, which is kept until the file is modified
+        """
+
+        modified = os.path.getmtime(procedure_file)
+        key = (os.path.abspath(procedure_file), substring_match)
+        indexed = self.procedure_indexes.get(key)
+
+        if indexed is None or indexed[0] != modified:
+            indexed = (modified, load_procedure_index(procedure_file, substring_match))
+            self.procedure_indexes[key] = indexed
+
+        return indexed[1]
+
+    def translate(self, request: dict) -> dict:
+        """
+            {"infile", "procfile", "outfile" (optional), "substring", "jobs", "no_format"} - as the command line
+        """
+
+        procedures = self.procedures(request['procfile'], bool(request.get('substring')))
+        row_count = translate_script_file(request['infile'], procedures, None, request.get('outfile', ''),
+                                          int(request.get('jobs') or 1),
+                                          formatting=not request.get('no_format'))
+
+        return {'rows': row_count}
+
+    def split(self, request: dict) -> dict:
+        """
+            {"infile", "outfolder", "format", "jobs", "procfile", "substring"} - as the CreateRAGUFiles.py command
+            line, where with a procfile the untranslated script is translated as it is split
+        """
+
+        import CreateRAGUFiles
+
+        jobs = int(request.get('jobs') or 1)
+        out_format = request.get('format', 'xlsx')
+
+        if out_format not in CreateRAGUFiles.OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format {out_format}, expected one of "
+                             f"{', '.join(CreateRAGUFiles.OUTPUT_FORMATS)}")
+
+        if request.get('procfile'):
+            procedures = self.procedures(request['procfile'], bool(request.get('substring')))
+            doors_ids = CreateRAGUFiles.translate_and_split(request['infile'], procedures, request['outfolder'],
+                                                            jobs, out_format)
+        else:
+            doors_ids = CreateRAGUFiles.split_script(request['infile'], request['outfolder'], jobs, out_format)
 
-        Button(self.master, text='Exit', command=self.menu_exit).place(x=85, y=350)
+        return {'doors_ids': doors_ids}
 
-        self.t_out.delete('1.0', 'end')
-        self.t_out.insert('end', self.help_text)
+    def status(self) -> dict:
+        return {'requests': self.requests,
+                'procedure_files': len(self.procedure_indexes),
+                'uptime': round(time.perf_counter() - self.started, 1)}
 
-    def get_script_file(self):
-        script_filename = filedialog.askopenfilename(initialdir="/", title="Select Script file",
-                                                     filetypes=(("Excel Files", "*.xlsx"), ("all files", "*.*")))
-        self.t_scr.delete('1.0', 'end')
-        self.t_scr.insert('end', script_filename)
+    def handle(self, command: str, request: dict) -> dict:
+        """
+            Runs one request. Returns the reply, with ok False and the error if it failed
+        """
 
-    def get_procedure_file(self):
-        proc_filename = filedialog.askopenfilename(initialdir="/", title="Select Procedures file",
-                                                   filetypes=(("Excel Files", "*.xlsx"), ("all files", "*.*")))
-        self.t_proc.delete('1.0', 'end')
-        self.t_proc.insert('end', proc_filename)
+        self.requests = self.requests + 1
+        start = time.perf_counter()
 
-    def get_logfile(self):
-        log_filename = filedialog.askopenfilename(initialdir="/", title="Select Logfile",
-                                                  filetypes=(("Log file", "*.txt"), ("all files", "*.*")))
-        self.t_log.delete('1.0', 'end')
-        self.t_log.insert('end', log_filename)
+        try:
+            if command == 'translate':
+                reply = self.translate(request)
+            elif command == 'split':
+                reply = self.split(request)
+            elif command == 'status':
+                reply = self.status()
+            else:
+                return {'ok': False, 'error': f"Unknown request {command}"}
+        except SystemExit:                              # open_excel/close_excel have already logged the reason
+            reply = {'ok': False, 'error': "Unable to open or save the file"}
+        except (KeyError, ValueError, OSError) as ex:
+            reply = {'ok': False, 'error': f"{type(ex).__name__}: {ex}"}
+        except Exception as ex:                         # still reply, rather than dropping the connection
+            logger.exception("Service: %s %s failed", command, request)
+            reply = {'ok': False, 'error': f"{type(ex).__name__}: {ex}"}
+        else:
+            reply['ok'] = True
+
+        reply['seconds'] = round(time.perf_counter() - start, 3)
+        logger.info("Service: %s %s - %s", command, request, reply)
+
+        return reply
+
+
+class ServiceRequestHandler:
+    """
+    POST /translate, /split or /status with a JSON request, and get a JSON reply. POST /shutdown stops the service.
+    Requests are handled one at a time, as the translation is not thread safe.
+    Only application/json requests carrying the service token are accepted - a web page can send a text/plain POST
+    to localhost, but cannot set the Content-Type to JSON or add the token without the browser checking first.
+    This is mixed in with http.server's BaseHTTPRequestHandler by run_service, so that http.server is only imported
+    when the service is started
+    """
+
+    def do_POST(self):
+        command = self.path.strip('/')
+
+        if self.headers.get_content_type() != 'application/json':
+            self.send_reply(415, {'ok': False, 'error': "Requests must be application/json"})
+            return
+
+        if not hmac.compare_digest(self.headers.get(SERVICE_TOKEN_HEADER, ''), self.server.token):
+            self.send_reply(403, {'ok': False, 'error': "Missing or wrong service token"})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError as ex:
+            self.send_reply(400, {'ok': False, 'error': f"Bad request: {ex}"})
+            return
+
+        if not isinstance(request, dict):
+            self.send_reply(400, {'ok': False, 'error': "Bad request: expected a JSON object"})
+            return
+
+        if command == 'shutdown':
+            self.send_reply(200, {'ok': True})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return
+
+        reply = self.server.service.handle(command, request)
+        self.send_reply(200 if reply['ok'] else 500, reply)
+
+    def send_reply(self, status: int, reply: dict):
+        body = json.dumps(reply).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("Service: " + format, *args)
+
+
+def run_service(logfile: str, port: int = SERVICE_PORT, log_level: int = logging.INFO, log_queue: bool = False):
+    """
+        Runs the translation service on localhost until it is sent /shutdown (or interrupted), keeping the rules
+        and procedure indexes in memory between requests - see translateClient.py for sending the requests.
+        The token the requests must carry is written to the service_token_file, and removed when the service stops
+    """
+
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+
+    setup_logging(logfile, 'w', log_level, log_queue)
+    token_file = service_token_file(port)
+
+    try:
+        handler = type('ServiceRequestHandler', (ServiceRequestHandler, BaseHTTPRequestHandler), {})
+        server = HTTPServer(('127.0.0.1', port), handler)
+        server.service = TranslationService()
+        server.token = write_service_token(token_file)
+
+        print(f"Translation service listening on http://127.0.0.1:{port}, token in {token_file}")
+        logger.info("Translation service listening on port %s, token in %s", port, token_file)
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+        server.server_close()
+        os.remove(token_file)
+        logger.info("Translation service stopped after %s requests", server.service.requests)
+    finally:
+        stop_logging()
+
+
+# Least time between progress updates sent to the GUI, in seconds
+PROGRESS_INTERVAL = 0.1
+
+
+class ProgressQueue:
+    """
+    Passes the progress of a translation, running in a worker thread, back to the GUI - which polls the messages
+    with after(), as Tk can only be used from its own thread. The rows are batched up, so the GUI is only
+    updated every PROGRESS_INTERVAL, however fast they are translated.
+    The GUI sets cancelled to stop the translation
+    """
 
-    def menu_exit(self):
-        exit()
+    def __init__(self):
+        self.messages = queue.Queue()
+        self.cancelled = threading.Event()
+        self.pending = []
+        self.last_update = 0.0
 
-    def process_script(self):
+    def stage(self, text: str, total_rows: int = 0):
+        self.messages.put(('stage', text, total_rows))
 
-        self.t_out.delete('1.0', 'end')
+    def row(self, row_count: int, text: str):
+        self.pending.append(text)
 
-        script_file = self.t_scr.get('1.0', 'end-1c')           # "end - 1c" removes \n from text
-        procedure_file = self.t_proc.get('1.0', 'end-1c')
-        logfile = self.t_log.get('1.0', 'end-1c')
+        if time.monotonic() - self.last_update >= PROGRESS_INTERVAL:
+            self.flush(row_count)
 
-        self.t_out.insert('end', 'Using Script file: {}\n'.format(script_file))
-        self.t_out.insert('end', 'Using Procedure file: {}\n'.format(procedure_file))
-        self.t_out.insert('end', 'Using Logfile: {}\n'.format(logfile))
+    def flush(self, row_count: int):
+        self.messages.put(('rows', row_count, '\n'.join(self.pending) + '\n' if self.pending else ''))
+        self.pending = []
+        self.last_update = time.monotonic()
 
-        run_processing_engine(script_file, procedure_file, logfile, True)
+    def finished(self, row_count: int, seconds: float, error: str = ''):
+        self.messages.put(('finished', row_count, seconds, error))
 
-        self.t_out.insert('end', "\nFinished")
-        self.t_out.see('end')
 
 def feature1():
     print ("This is feature one")
@@ -1273,7 +2763,5 @@ if __name__ == "__main__":
     if len(sys.argv) > 1:
         process_command_line(sys.argv[1:])
     else:
-        root = Tk()
-        root.geometry("950x400")
-        app = Window(root)                                         # creation of an instance
-        root.mainloop()                                            # mainloop
+        from translateDOORSgui import run_gui                      # only load Tk when the GUI is wanted
+        run_gui()